@@ -0,0 +1,55 @@
+import json
+from bisect import insort, bisect_left
+from collections import deque
+
+# State abstractions over sliding windows of a trace.
+# States are keyed by tuples of interned activity codes and interned to integer state ids,
+# the readable labels (as written to the .gexf files) are only constructed on demand.
+
+# key of the initial state "start"
+START = ()
+
+# Interns the activity names of a trace, returns the list of activity codes
+def activity_codes(names, activities):
+    return [activities.setdefault(name, len(activities)) for name in names]
+
+# Interns a state key, returns the state id
+def intern(states, key):
+    return states.setdefault(key, len(states))
+
+# Rolling sequence-history: yields the key of the window ending at every position after the start event
+def sequence_keys(codes, history):
+    window = deque(codes[:1], maxlen = history)
+    for code in codes[1:]:
+        window.append(code) # drops the expired code
+        yield tuple(window)
+
+# Rolling multiset-history: the window is kept as sorted list of codes, the expired code is removed
+def multiset_keys(codes, history):
+    window = deque(codes[:1])
+    ordered = list(codes[:1])
+    for code in codes[1:]:
+        window.append(code)
+        insort(ordered, code)
+        if len(window) > history:
+            del ordered[bisect_left(ordered, window.popleft())]
+        yield tuple(ordered)
+
+def sequence_label(key, names):
+    return " - ".join(str(names[code]) for code in key)
+
+# use json encodings for multisets
+def multiset_label(key, names):
+    multiset = {}
+    for code in key:
+        multiset[names[code]] = multiset.get(names[code], 0) + 1
+    return json.dumps(multiset, sort_keys=True)
+
+def keys(abstraction_type):
+    return sequence_keys if abstraction_type == "sequence" else multiset_keys
+
+# Returns the readable labels of all interned states, indexed by state id
+def state_labels(states, activities, abstraction_type):
+    names = list(activities)
+    label = sequence_label if abstraction_type == "sequence" else multiset_label
+    return [label(key, names) if key != START else "start" for key in states]
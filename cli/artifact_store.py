@@ -0,0 +1,106 @@
+import os
+import glob
+import json
+import time
+import hashlib
+import threading
+import graph_format
+
+# Content-addressed store for the intermediate graphs of the pipeline (process models, games, decision boundaries, reductions).
+# An artifact is keyed on the hash of its input artifact, the stage and the parameters of the stage; the key of an
+# artifact is the hash its successors are keyed on, the log is hashed by its content (see log_cache.py).
+# Artifacts are stored in the binary graph format (see graph_format.py),
+# entries are evicted least recently used first once the store exceeds its size limit.
+# The store directory is set by the environment variable BPI_GAMES_ARTIFACTS, default: ~/.cache/bpi_games/artifacts,
+# the size limit in bytes by BPI_GAMES_ARTIFACTS_LIMIT, default: 2 GB
+
+STORE_VERSION = 3
+STALE_TMP = 24*3600 # seconds after which a temporary file is considered left over by a killed writer
+
+def store_directory():
+    return os.environ.get("BPI_GAMES_ARTIFACTS", os.path.join(os.path.expanduser("~"), ".cache", "bpi_games", "artifacts"))
+
+def size_limit():
+    return int(os.environ.get("BPI_GAMES_ARTIFACTS_LIMIT", 2*1024**3))
+
+# Content hash of a file, the key of logs and of graphs read from files
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def key(stage, input_key, parameters):
+    h = hashlib.sha256()
+    h.update(json.dumps([STORE_VERSION, stage, input_key, parameters], sort_keys = True).encode())
+    return h.hexdigest()
+
+def path(key):
+    return os.path.join(store_directory(), key + graph_format.EXTENSIONS["binary"])
+
+# Returns the stored graph, None on a miss; a hit counts as use for the eviction
+def lookup(key):
+    try:
+        g = graph_format.read_binary(path(key))
+        os.utime(path(key))
+        return g
+    except (OSError, ValueError, KeyError, IndexError):
+        return None
+
+def store(key, g):
+    os.makedirs(store_directory(), exist_ok=True)
+    tmp = tmp_path(key, os.getpid(), threading.get_ident())
+    graph_format.write_binary(g, tmp)
+    os.replace(tmp, path(key)) # atomic, concurrent runs never read partial files
+    evict(size_limit())
+
+# Looks up the artifact of the stage for the input key and parameters, computes and stores it on a miss
+# Returns the artifact and its key; without input key (store disabled) the artifact is computed and its key is None
+# A computed artifact that is not final is neither stored nor are the artifacts derived from it (its key is None)
+def cached(stage, input_key, parameters, compute, final = lambda g: True):
+    if input_key is None:
+        return compute(), None
+    k = key(stage, input_key, parameters)
+    g = lookup(k)
+    if g is None:
+        g = compute()
+        if not final(g):
+            return g, None
+        store(k, g)
+    return g, k
+
+def tmp_path(key, pid, thread):
+    return path(key) + ".tmp" + str(pid) + "_" + str(thread)
+
+# Removes the partially written entries of the (killed) process pid
+def remove_temporary(pid):
+    for name in glob.glob(tmp_path("*", pid, "*")):
+        try:
+            os.remove(name)
+        except OSError:
+            pass
+
+# Removes the least recently used entries until the store is not larger than limit bytes,
+# temporary files older than STALE_TMP are left over by killed writers and removed too
+def evict(limit):
+    entries = []
+    for name in os.listdir(store_directory()):
+        try:
+            stat = os.stat(os.path.join(store_directory(), name))
+            if ".tmp" in name:
+                if time.time() - stat.st_mtime > STALE_TMP:
+                    os.remove(os.path.join(store_directory(), name))
+                continue # written concurrently
+        except OSError:
+            continue # removed concurrently
+        entries.append((stat.st_mtime, stat.st_size, name))
+    size = sum(entry[1] for entry in entries)
+    for mtime, entry_size, name in sorted(entries):
+        if size <= limit:
+            break
+        try:
+            os.remove(os.path.join(store_directory(), name))
+        except OSError:
+            pass
+        size -= entry_size
@@ -1,6 +1,7 @@
 import argparse
-import networkx as nx
 import json 
+import graph_format
+import artifact_store
 
 parser = argparse.ArgumentParser(
                     prog = 'build_game',
@@ -8,25 +9,36 @@ parser = argparse.ArgumentParser(
 parser.add_argument('input', help = "Input model")
 parser.add_argument('output', help = "Output path for game") 
 parser.add_argument('activities', help = "JSON-file storing controllability of edges") 
+parser.add_argument('-ns', '--no_store', help = "Neither reuses nor stores the game in the artifact store (see artifact_store.py); default = False", action = 'store_true') 
+parser.add_argument('-f', '--format', help = "File format of the written game: 'gexf' (e.g. for Gephi and the notebooks) or 'binary' (compact, read via memory map, see graph_format.py); default = gexf", default = "gexf", choices = ["binary", "gexf"]) 
 
-args = parser.parse_args()
+# Annotates the controllability of the edges: an edge is controllable if its action belongs to the company,
+# actions of no actor are controllable
+def build_game(g, actors):
+    for e in g.edges:
+        controllable_set = False
+        for key in actors:
+            if key in g.edges[e]['action']:
+                controllable_set = True
+                g.edges[e]['controllable'] = actors[key] == 'company'
+        if not controllable_set:
+            g.edges[e]['controllable'] = True
+    return g
 
-g = nx.read_gexf(args.input)
+def output_name(output, input, activities, file_format = graph_format.DEFAULT_FORMAT):
+    return output + "GAME" + input.split("/")[-1].split(".")[0].split("PMODEL")[-1] + "_" + "actors:" + activities.split("/")[-1] + graph_format.EXTENSIONS[file_format]
 
-with open(args.activities) as f:
-    data = f.read()
-actors = json.loads(data)
-keys = list(actors.keys())
+if __name__ == "__main__":
+    args = parser.parse_args()
 
-for e in g.edges:
-    controllable_set = False
-    for key in actors:
-        if key in g.edges[e]['action']:
-            controllable_set = True
-            g.edges[e]['controllable'] = actors[key] == 'company'
-    if not controllable_set:
-        g.edges[e]['controllable'] = True
+    with open(args.activities) as f:
+        data = f.read()
+    actors = json.loads(data)
 
-name = args.output + "GAME" + args.input.split("/")[-1].split(".")[0].split("PMODEL")[-1] + "_" + "actors:" + args.activities.split("/")[-1]+'.gexf'
-nx.write_gexf(g, name)
-print("Generated:", name)
\ No newline at end of file
+    # the game is keyed on the content hash of the process model file
+    input_key = None if args.no_store else artifact_store.file_hash(args.input)
+    g, _ = artifact_store.cached("game", input_key, {"actors" : actors}, lambda: build_game(graph_format.read_graph(args.input), actors))
+
+    name = output_name(args.output, args.input, args.activities, args.format)
+    graph_format.write_graph(g, name)
+    print("Generated:", name)
@@ -1,113 +1,199 @@
 import argparse
+import re
 import networkx as nx
-import copy 
+from collections import deque
 import subprocess
+import concurrent.futures
+import tempfile
+import glob
+import os
+import game_solver
+import verdict_cache
+import reduction
+import reachability
+import graph_format
+import artifact_store
 
 parser = argparse.ArgumentParser(
                     prog = 'decision_boundary',
                     description = "Computes the decision boundary of the given game.",)
 parser.add_argument('input', help = "Input model")
 parser.add_argument('output', help = "Output path for game with annotated decision boundary")
-parser.add_argument('uppaal_stratego', help = "Path to Uppaal Stratego's VERIFYTA") 
+parser.add_argument('uppaal_stratego', help = "Path to Uppaal Stratego's VERIFYTA, only needed for the backends 'verifyta' and 'crosscheck'", nargs = '?', default = None) 
 parser.add_argument('-d', '--debug', help = "Print additional information", default = False) 
 parser.add_argument('-q', '--query', help = "Path to the boolean query for the decision boundary.", default = 'guaranteed_tool.q')
 parser.add_argument('-k', '--unrolling_factor', help = "Constant factor how often every lop is unrolled; default = 0", type = int, default = 0) 
 parser.add_argument('-s', '--static', help = "Game decision boundary with neglecting game properties (static decision boundary); default = False", type = bool, default = False) 
+parser.add_argument('-b', '--backend', help = "Game solver: 'verifyta' (UPPAAL Stratego), 'attractor' (in-process attractor computation, only for the query of guaranteed_tool.q) or 'crosscheck' (both, mismatches are reported); default = verifyta", default = "verifyta", choices = ["verifyta", "attractor", "crosscheck"]) 
+parser.add_argument('-w', '--workers', help = "Number of games verified concurrently; default = 1", type = int, default = 1) 
+parser.add_argument('-qt', '--query_timeout', help = "Timeout per verifyta query in seconds, a query exceeding it is counted as not guaranteed; default = no timeout", type = float, default = None) 
+parser.add_argument('-nc', '--no_cache', help = "Neither reads nor stores verifyta results in the persistent verdict cache; default = False", action = 'store_true') 
+parser.add_argument('-batch', '--batched', help = "Verifies all games that are ready at the same time in one UPPAAL model with one query per game, by a single verifyta call (the query file has to contain exactly one query 'control: A<> ...', the timeout of the call is '--query_timeout' times the number of games, the games whose verdict is not printed by then count as timed out); default = False", action = 'store_true') 
+parser.add_argument('-cs', '--collapse_solved', help = "Replaces the decided states leaving the strongly connected component of a state by positive or negative sinks before its sub-game is unrolled and verified; default = False", action = 'store_true') 
+parser.add_argument('-nl', '--no_layout', help = "Writes the UPPAAL models without graphviz layout (locations on a grid), the layout only matters for viewing the models; default = False", action = 'store_true') 
+parser.add_argument('-ws', '--warm_start', help = "Decision boundary of the game for another (e.g. the previous) unrolling factor: the results of the states that reach no cycle are taken from it, only the other states are computed again; default = None", default = None) 
+parser.add_argument('-ns', '--no_store', help = "Neither reuses nor stores the decision boundary in the artifact store, decision boundaries with timed out queries are never stored (see artifact_store.py); default = False", action = 'store_true') 
+parser.add_argument('-f', '--format', help = "File format of the written game with the decision boundary: 'gexf' (e.g. for Gephi and the notebooks) or 'binary' (compact, read via memory map, see graph_format.py); default = gexf", default = "gexf", choices = ["binary", "gexf"]) 
+
+# Options of the computation: the command line arguments, set by configure() if the module is imported (see pipeline.py)
+args = None
+
+# States whose query exceeded the timeout in the last query(), they are counted as not guaranteed:
+# the results then depend on the machine load and are not cached (see verdict_cache.py and pipeline.py)
+timed_out = []
+
+# Options changing the decision boundary, the others only affect how it is computed
+STORED_OPTIONS = ["static", "backend", "query_timeout", "collapse_solved", "unrolling_factor"]
+
+# Parameters the stored decision boundaries are keyed on (see artifact_store.py), for the given options and the defaults of the others
+def store_parameters(options):
+    parameters = {p : options.get(p, parser.get_default(p)) for p in STORED_OPTIONS}
+    parameters["query"] = artifact_store.file_hash(options.get("query", parser.get_default("query")))
+    return parameters
+
+# Sets the options to the defaults of the command line, overridden by the given options
+def configure(**options):
+    global args
+    args = parser.parse_args(["", ""])
+    for key in options:
+        assert(hasattr(args, key))
+        setattr(args, key, options[key])
+    return args
+
+# Cycle bookkeeping of the unrolling: the simple cycles of the graph are indexed by their edges,
+# per node of the unrolled graph the completions of every cycle rotation within its history are counted incrementally
+# (the number of completions of a cycle corresponds to the maximum over its rotations)
+
+# Returns the successor of every node per cycle and the ids of the cycles containing an edge, per edge
+def cycle_index(G):
+    successors = []
+    edge_cycles = {}
+    for c in nx.simple_cycles(G):
+        successors.append({c[i] : c[(i+1) % len(c)] for i in range(len(c))})
+        for e in successors[-1].items():
+            edge_cycles.setdefault(e, []).append(len(successors)-1)
+    return successors, edge_cycles
+
+# Histories of the unrolled nodes are stored as pairs (last activity, history of the parent), None is the empty history
+# A node thereby only references the history of its parent, a reassigned history does not change the histories derived from the old one
+
+# checks if the history ends with a complete traversal of the cycle
+def completes(hist, successor):
+    for i in range(len(successor)):
+        if hist[1] is None or successor.get(hist[1][0]) != hist[0]:
+            return False
+        hist = hist[1]
+    return True
+
+# Counts of the history after appending its last element, only the given cycles can be completed by it
+# Counts are keyed by (cycle id, first node of the rotation) and shared with the parent if unchanged
+def count_completions(counts, hist, cycle_ids, successors):
+    updated = counts
+    for c in cycle_ids:
+        if completes(hist, successors[c]):
+            if updated is counts:
+                updated = dict(counts)
+            updated[(c, hist[0])] = updated.get((c, hist[0]), 0) + 1
+    return updated
+
+# number of completions of the cycle in the history
+def cycle_count(counts, c, successors):
+    return max(counts.get((c, n), 0) for n in successors[c])
+
+# Nodes from which one of the targets is reachable without entering the excluded nodes
+def reaching(G, targets, excluded):
+    reached = set(t for t in targets if t not in excluded)
+    queue = deque(reached)
+    while queue:
+        t = queue.popleft()
+        for s in G.predecessors(t):
+            if s not in reached and s not in excluded:
+                reached.add(s)
+                queue.append(s)
+    return reached
+
+# Last path of nx.all_simple_paths(G, source, targets) without enumerating the paths, None if there is no path:
+# the paths are enumerated by depth-first search in the order of the successors, the last one takes the last
+# successor from which a target is still reachable without revisiting the path
+def last_simple_path(G, source, targets):
+    if source in targets:
+        return None
+    path = [source]
+    visited = {source}
+    while True:
+        reached = reaching(G, targets, visited)
+        candidates = [n for n in G[path[-1]] if n in reached]
+        if not candidates:
+            return path if path[-1] in targets else None
+        path.append(candidates[-1])
+        visited.add(candidates[-1])
 
-args = parser.parse_args()
-
-# Computes all possible shift of lists
-def shifted_lists(l):
-    shifted_lists = []
-    for j in range(len(l)):
-        list_constructed = copy.deepcopy(l[j:])
-        list_constructed.extend(l[:j])
-        list_constructed.append(list_constructed[0])
-        shifted_lists.append(list_constructed)
-    return shifted_lists
-
-# checks if history hist contains circle c
-def contains(hist, c):
-    n = len(c)+1
-    max_count = 0
-    lists = shifted_lists(c)
-    for helper_list in lists:
-        count = 0
-        for i in range(len(hist)-(n-1)):
-            if hist[i:i+n] == helper_list:
-                count += 1
-        max_count = max(max_count, count)
-    return max_count
-
-# returns true if edge (e,v) is on c
-def is_on(e,v,c):
-    for i in range(len(c)-1):
-        if c[i] == e and c[i+1] == v:
-            return True
-    if c[-1] == e and c[0] == v:
-        return True
-    
 # Presented Unrolling algorithm, Algorithm 1 with online reducing
-def unroll(G, start, target, k, debug = args.debug):
+def unroll(G, start, target, k, debug = False):
     G_gen = nx.DiGraph()
-    G_gen.add_node(start, hist = [str(start)])
+    G_gen.add_node(start, hist = (str(start), None))
     if 'controllable' in G.nodes[start]:
         G_gen.nodes[start]["controllable"] = G.nodes[start]["controllable"]
 
-    cycles = list(nx.simple_cycles(G))
+    successors, edge_cycles = cycle_index(G)
+    targets = set(target)
+    counters = {start : {}}
+    copies = {}
+    last_paths = {}
 
-    queue = [start]
+    # frontier of the search, indexed by a set for the membership test
+    queue = deque([start])
+    queued = {start}
     # start bf-search
     while(queue):
         if debug:
             print(len(G_gen.nodes), len(queue))
-        s = queue[0]
-        queue.pop(0)
+        s = queue.popleft()
+        queued.remove(s)
         s_original = str(s).split(".")[0]
         neighbours = list(G[s_original])
         for t in neighbours:
             t_original = t
-            local_hist = copy.deepcopy(G_gen.nodes[s]["hist"])
-            local_hist.append(str(t_original))
-            is_on_cycle = False
+            local_hist = (str(t_original), G_gen.nodes[s]["hist"])
             can_traverse = False
-            path = []
-            circle = []
-            relevant_cycle = []
-            for c in cycles:
-                if is_on(s_original,t_original,c):
-                    relevant_cycle.append(c)
+            relevant_cycle = edge_cycles.get((s_original, t_original), [])
+            counts = count_completions(counters[s], local_hist, relevant_cycle, successors)
                     
             all_smaller = True
             for c in relevant_cycle:
-                if contains(local_hist,c) >= k:
+                if cycle_count(counts, c, successors) >= k:
                     all_smaller = False
             
             if not all_smaller:
-                paths = list(nx.all_simple_paths(G, source=t, target=target))
-                for p in paths:
-                    merged_hist = copy.deepcopy(local_hist)
-                    merged_hist.extend(p[1:]) # 1.st element already added
-                    can_not_traverse = False
+                # the last simple path to a target decides, as in the enumeration of all simple paths
+                if t_original not in last_paths:
+                    last_paths[t_original] = last_simple_path(G, t_original, targets)
+                p = last_paths[t_original]
+                if p is not None:
+                    merged_hist = local_hist
+                    merged_counts = counts
+                    for n in p[1:]: # 1.st element already added
+                        merged_hist = (str(n), merged_hist)
+                        merged_counts = count_completions(merged_counts, merged_hist, relevant_cycle, successors)
                     
                     #test if no loop larger than k with path
-                    for c_loop in relevant_cycle:
-                        if contains(merged_hist,c_loop) > k : # check that there is path without completing additional cycle
-                            can_not_traverse = True
-                    can_traverse = not can_not_traverse
+                    can_traverse = all(cycle_count(merged_counts, c, successors) <= k for c in relevant_cycle)
             if all_smaller or can_traverse:               
                 #every node not on cycle can be unqiue ("merge point" within unrolled graph)
-                if relevant_cycle:
-                    while t in G_gen.nodes:
-                        if "." not in t:
-                            t += ".1"
-                        else:
-                            t = t.split(".")[0]+"."+str(int(t.split(".")[-1])+1)
+                # copies are numbered consecutively, the counter per node continues after the last copy
+                if relevant_cycle and t in G_gen:
+                    copy_number = copies.get(t_original, 0) + 1
+                    while t_original+"."+str(copy_number) in G_gen:
+                        copy_number += 1
+                    copies[t_original] = copy_number
+                    t = t_original+"."+str(copy_number)
                 # add node t only to graph if not already treated
 
-                if t not in queue:
+                if t not in queued:
                     queue.append(t)
+                    queued.add(t)
                     G_gen.add_node(t, hist = local_hist)
+                    counters[t] = counts
                 assert(s in G_gen and t in G_gen)
                 G_gen.add_edge(s,t)
                 if('cost' in G[s_original][t_original]):
@@ -117,206 +203,421 @@ def unroll(G, start, target, k, debug = args.debug):
 
     return G_gen
 
+HEADER = ('<?xml version="1.0" encoding="utf-8"?>'
+    "<!DOCTYPE nta PUBLIC '-//Uppaal Team//DTD Flat System 1.1//EN' 'http://www.it.uu.se/research/group/darts/uppaal/flat-1_1.dtd'>"
+    '<nta>'
+    '<declaration>'
+    'int e = 0;'
+    '\n'+'clock x;'
+    '\n'+'hybrid clock t;'
+    '\n'+'int steps;'
+    '\n'+'bool reached_positive = false;'
+    '\n'+'bool reached_negative = false;'
+    '\n'+'int final_gas = -1;'
+    '\n'+'int game = -1;'
+    '</declaration>'
+    '<template>'
+    '<name x="5" y="5">Template</name>')
+
+FOOTER = ('</template>'
+    '<system>'
+    'Journey = Template();'
+    'system Journey;'
+    '</system>'
+    '</nta>')
+
+# characters replaced in location names, the second table is applied for the displayed name
+SANITIZE = str.maketrans({'"': '-', '{': None, '}': None, "'": '-', '_': None, '(': None, ')': None})
+SANITIZE_DISPLAY = str.maketrans({':': None, ' ': None, '.': None, ',': None, '-': None})
+
+# Grid positions, used instead of a graphviz layout if no layout is requested (verifyta ignores the coordinates)
+def grid_layout(g, columns = 20, spacing = 150):
+    return {s : (spacing*(i % columns), spacing*(i // columns)) for i, s in enumerate(g)}
+
 # construction of uppaal model (write model into upaal file)
-def to_uppaal(g, name, layout = "sfdp", debug = args.debug):
-    f = open(name, "w+")
-    
-    pos = nx.drawing.nx_agraph.graphviz_layout(g, prog=layout, args='-Grankdir=LR')
-
-    f.write('<?xml version="1.0" encoding="utf-8"?>')
-    f.write("<!DOCTYPE nta PUBLIC '-//Uppaal Team//DTD Flat System 1.1//EN' 'http://www.it.uu.se/research/group/darts/uppaal/flat-1_1.dtd'>")
-    f.write('<nta>')
-    f.write('<declaration>')
-    f.write('int e = 0;')
-    f.write('\n'+'clock x;')
-    f.write('\n'+'hybrid clock t;')
-    f.write('\n'+'int steps;')
-    f.write('\n'+'bool reached_positive = false;')
-    f.write('\n'+'bool reached_negative = false;')
-    f.write('\n'+'int final_gas = -1;')
-    f.write('</declaration>')
-    f.write('<template>')
-    f.write('<name x="5" y="5">Template</name>')
+# the model is assembled in memory and written at once
+def to_uppaal(g, name, layout = "sfdp", debug = False):
+    if layout is None:
+        pos = grid_layout(g)
+    else:
+        pos = nx.drawing.nx_agraph.graphviz_layout(g, prog=layout, args='-Grankdir=LR')
+
+    parts = [HEADER]
     
     # print locations
     ids = {}
     for s,i in zip(pos, range(len(pos))):
         ids[s] = i
-        print_location(f, "id"+str(i),pos[s][0],pos[s][1],s)
-        f.write('\n')
+        parts.append(print_location("id"+str(i),pos[s][0],pos[s][1],str(s).translate(SANITIZE)))
+        parts.append('\n')
                     
-    f.write('<init ref="id'+str(ids['start'])+'"/>')
+    parts.append('<init ref="id'+str(ids['start'])+'"/>')
     
     for e in g.edges:
         assert("cost" in g[e[0]][e[1]] and "controllable" in g[e[0]][e[1]])
-        print_edge(f, ids[e[0]], ids[e[1]], pos[e[0]], pos[e[1]], g[e[0]][e[1]]['cost'], g[e[0]][e[1]]['controllable'], e, g)
-
-    f.write('</template>')
-    f.write('<system>')
-    f.write('Journey = Template();')
-    f.write('system Journey;')
-    f.write('</system>')
-    f.write('</nta>')
-    f.close()
+        parts.append(print_edge(ids[e[0]], ids[e[1]], pos[e[0]], pos[e[1]], g[e[0]][e[1]]['cost'], g[e[0]][e[1]]['controllable'], e, g))
+
+    parts.append(FOOTER)
+    with open(name, "w+") as f:
+        f.write("".join(parts))
     if debug:
-        print("all written to", f.name)
-
-def print_location(f, location_id, x, y, name):
-    name = str(name)
-    name = name.replace('"', '-')
-    name = name.replace('{', '')
-    name = name.replace('}', '')
-    name = name.replace("'", '-')
-    name = name.replace("_", '')
-    name = name.replace("(", '')
-    name = name.replace(")", '')
-    f.write('<location id="'+location_id+'" x="'+str(int(x))+'" y="'+str(int(y))+'">')
-    f.write('<name x="'+str(int(x))+'" y="'+str(int(y)+20)+'">'+str(name).replace(":", "").replace(" ","").replace(".", "").replace(",", "").replace("-","")+'</name>')
-    f.write('<label kind="invariant" x="'+str(int(x))+'" y="'+str(int(y)-30)+'">')
+        print("all written to", name)
+
+# XML of a location, name is the sanitized location name
+def print_location(location_id, x, y, name):
+    x, y = int(x), int(y)
     if "positive" not in name and "negative" not in name and "outOfGas" not in name:
-        f.write('x &lt;= ' + str(2))
+        invariant = 'x &lt;= ' + str(2)
     else:
-        f.write("t'==0")
-    f.write('</label>')
-    f.write('</location>')
-
-def print_edge(f, s, t, pos_s, pos_t, w, controllable, e, g, guard = False):
+        invariant = "t'==0"
+    return ('<location id="'+location_id+'" x="'+str(x)+'" y="'+str(y)+'">'
+        '<name x="'+str(x)+'" y="'+str(y+20)+'">'+name.translate(SANITIZE_DISPLAY)+'</name>'
+        '<label kind="invariant" x="'+str(x)+'" y="'+str(y-30)+'">'+invariant+'</label>'
+        '</location>')
+
+# XML of a transition
+def print_edge(s, t, pos_s, pos_t, w, controllable, e, g, guard = False):
     x = (pos_s[0]+pos_t[0])/2
     y = (pos_s[1]+pos_t[1])/2
-    if controllable:
-        f.write('<transition action = "">')
-    else:
-        f.write('<transition controllable="false" action = "">')
-    f.write('<source ref="id'+str(s)+'"/>')
-    f.write('<target ref="id'+str(t)+'"/>')
+    w = str(int(round(w)))
+    parts = ['<transition action = "">' if controllable else '<transition controllable="false" action = "">']
+    parts.append('<source ref="id'+str(s)+'"/>')
+    parts.append('<target ref="id'+str(t)+'"/>')
         
-    f.write('<label kind="assignment" x="'+str(int(x))+'" y="'+str(int(y))+'">')
-    f.write(' steps += 1')
-    f.write(',\n'+ 'x = 0')
+    parts.append('<label kind="assignment" x="'+str(int(x))+'" y="'+str(int(y))+'">')
+    parts.append(' steps += 1')
+    parts.append(',\n'+ 'x = 0')
     if "positive" in str(e[1]):
-        f.write(',\n'+ 'reached_positive = true')
-        f.write(',\n'+ 'final_gas = e +'+str(int(round(w))))
+        parts.append(',\n'+ 'reached_positive = true')
+        parts.append(',\n'+ 'final_gas = e +'+w)
     elif "negative" in str(e[1]):
-        f.write(',\n'+ 'reached_negative = true')
-        f.write(',\n'+ 'final_gas = e + '+str(int(round(w))))
+        parts.append(',\n'+ 'reached_negative = true')
+        parts.append(',\n'+ 'final_gas = e + '+w)
         
-    f.write(',\n'+'e = e + '+str(int(round(w))))
-    f.write('</label>')
+    parts.append(',\n'+'e = e + '+w)
+    if 'update' in g[e[0]][e[1]]:
+        parts.append(',\n'+g[e[0]][e[1]]['update'])
+    parts.append('</label>')
     
-    f.write('</transition>')
+    parts.append('</transition>')
+    return "".join(parts)
+
+# Layout of the written UPPAAL models, None for the grid
+def model_layout():
+    return None if args.no_layout else "sfdp"
+
+# Prefix of the temporary model and query files of the verifyta calls of process pid, kind is 'subgame' or 'batch'
+def temporary_prefix(output, kind, pid):
+    return os.path.basename(output) + kind + "_" + str(pid) + "_"
+
+# Removes the temporary files of the (killed) process pid, whose verifyta calls have to be finished
+def remove_temporary(output, pid):
+    for kind in ["subgame", "batch"]:
+        for name in glob.glob(os.path.join(os.path.dirname(output) or ".", glob.escape(temporary_prefix(output, kind, pid)) + "*")):
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+
+# Checks the query on the game with UPPAAL Stratego, every call uses its own model file
+# Returns None if the query exceeds the timeout
+def verify(g, query_path):
+    fd, name = tempfile.mkstemp(prefix = temporary_prefix(args.output, "subgame", os.getpid()), suffix = ".xml", dir = os.path.dirname(args.output) or ".")
+    os.close(fd)
+    try:
+        to_uppaal(g, name, model_layout(), args.debug)
+        out = subprocess.run([args.uppaal_stratego, name, query_path], stdout=subprocess.PIPE, timeout = args.query_timeout)
+        return "is satisfied" in str(out.stdout)
+    except subprocess.TimeoutExpired:
+        return None
+    finally:
+        os.remove(name)
+
+# Batched model: the initial location selects one of the games by a controllable edge that sets 'game',
+# the i-th query restricts the query formula to the i-th game
+def batch_model(games):
+    g = nx.DiGraph()
+    for i in range(len(games)):
+        g.update(nx.relabel_nodes(games[i], {s : "game"+str(i)+" "+str(s) for s in games[i]}))
+        g.add_edge("start", "game"+str(i)+" start", controllable = True, cost = 0, update = "game = "+str(i))
+    return g
+
+# Formula of the query file, which has to consist of exactly one query 'control: A<> formula'
+# (with an optional 'strategy name =' prefix, comments are skipped)
+def batch_formula(query_path):
+    with open(query_path) as f:
+        query = re.sub(r"/\*.*?\*/|//[^\n]*", "", f.read(), flags = re.DOTALL)
+    lines = [line.strip() for line in query.splitlines() if line.strip()]
+    match = re.fullmatch(r"(strategy\s+\w+\s*=\s*)?control\s*:\s*A<>(.+)", lines[0]) if len(lines) == 1 else None
+    if match is None:
+        raise ValueError("batched verification needs exactly one query 'control: A<> ...' in " + query_path)
+    return match.group(2).strip()
+
+def batch_queries(query_path, count):
+    formula = batch_formula(query_path)
+    return ["control: A<> ("+formula+") && game == "+str(i) for i in range(count)]
+
+# Verdicts of the queries printed by verifyta, in the order of the queries
+def verdicts(stdout):
+    return ["is satisfied" in line for line in stdout.decode().splitlines() if "Formula is" in line]
+
+# Checks the queries of all games by one verifyta call, returns the list of results
+# On timeout the verdicts printed so far are kept, the results of the remaining games are None
+def verify_batch(games, query_path):
+    directory = os.path.dirname(args.output) or "."
+    fd, name = tempfile.mkstemp(prefix = temporary_prefix(args.output, "batch", os.getpid()), suffix = ".xml", dir = directory)
+    os.close(fd)
+    fd, queries = tempfile.mkstemp(prefix = temporary_prefix(args.output, "batch", os.getpid()), suffix = ".q", dir = directory)
+    with os.fdopen(fd, "w") as f:
+        f.write("\n".join(batch_queries(query_path, len(games)))+"\n")
+    try:
+        to_uppaal(batch_model(games), name, model_layout(), args.debug)
+        timeout = None if args.query_timeout is None else args.query_timeout*len(games)
+        out = subprocess.run([args.uppaal_stratego, name, queries], stdout=subprocess.PIPE, timeout = timeout)
+        results = verdicts(out.stdout)
+        assert(len(results) == len(games))
+        return results
+    except subprocess.TimeoutExpired as e:
+        results = verdicts(e.stdout or b"")[:len(games)]
+        return results + [None]*(len(games)-len(results))
+    finally:
+        os.remove(name)
+        os.remove(queries)
+
+# Batched variant of decide, only games without cached result are verified
+def decide_batch(games, query_path, states):
+    backend = args.backend
+    if backend == "attractor":
+        return [game_solver.solve(g) for g in games]
+    keys = [verdict_cache.game_hash(g, query_path) if backend == "verifyta" and not args.no_cache else None for g in games]
+    results = [verdict_cache.lookup(key) if key is not None else None for key in keys]
+    missing = [i for i in range(len(games)) if results[i] is None]
+    if missing:
+        for i, result in zip(missing, verify_batch([games[i] for i in missing], query_path)):
+            if result is None:
+                print("Timeout - query for", states[i], "is counted as not guaranteed")
+                timed_out.append(states[i])
+                results[i] = False
+                continue
+            if backend == "crosscheck" and result != game_solver.solve(games[i]):
+                print("Mismatch between verifyta and attractor for", states[i], ": verifyta", result)
+            if keys[i] is not None:
+                verdict_cache.store(keys[i], result)
+            results[i] = result
+    return results
+
+# Decides the unrolled game of a state with the selected backend, verifyta results are cached (see verdict_cache.py)
+def decide(g, query_path, state):
+    backend = args.backend
+    if backend == "attractor":
+        return game_solver.solve(g)
+    key = None
+    if backend == "verifyta" and not args.no_cache:
+        key = verdict_cache.game_hash(g, query_path)
+        result = verdict_cache.lookup(key)
+        if result is not None:
+            if args.debug:
+                print("Cached result for", state, ":", result)
+            return result
+    result = verify(g, query_path)
+    if result is None:
+        print("Timeout - query for", state, "is counted as not guaranteed")
+        timed_out.append(state)
+        return False
+    if backend == "crosscheck" and result != game_solver.solve(g):
+        print("Mismatch between verifyta and attractor for", state, ": verifyta", result)
+    if key is not None:
+        verdict_cache.store(key, result)
+    return result
+
+# Job of the worker pool: unrolls the sub-games of the given states and decides them, together if batched
+def solve_states(candidates, query_path):
+    games = []
+    for state, subgraph in candidates:
+        target = [s for s in subgraph.nodes if "positive" in s or "negative" in s]
+        games.append(unroll(subgraph, "start", target, args.unrolling_factor, args.debug))
+    states = [state for state, subgraph in candidates]
+    if args.batched:
+        return decide_batch(games, query_path, states)
+    return [decide(games[i], query_path, states[i]) for i in range(len(games))]
+
+# Sub-game of all descendants of the state, with an additional start node
+# Decided states (mapping to their result) are replaced by a sink named after their result
+def sub_game(g, current_state, sub_nodes, decided = None):
+    subgraph = nx.subgraph(g, sub_nodes)
+    subgraph = nx.DiGraph(subgraph)
+    if decided:
+        subgraph.remove_edges_from([(s, t) for s in decided for t in g[s] if t in subgraph])
+        nx.relabel_nodes(subgraph, {s : ("positive " if decided[s] else "negative ")+str(s) for s in decided}, copy = False)
+
+    # add start node to subgraph
+    start_nodes = []
+    for n in subgraph.nodes:
+        if subgraph.in_degree(n) == 0:
+            start_nodes.append(n)
+    for n in start_nodes:
+        subgraph.add_edge("start", n)
+        subgraph["start"][n]["controllable"] = True
+        subgraph["start"][n]["cost"] = 0
+    # if initial node lies on cycle, per default set as start node
+    if "start" not in subgraph.nodes:
+        subgraph.add_edge("start", current_state)
+        subgraph["start"][current_state]["controllable"] = True
+        subgraph["start"][current_state]["cost"] = 0
+    return subgraph
+
+# Result of a state determined by its neighbours or by its reachable leaves, None if not determined
+# The neighbours are only taken into account if all of them are before the state in the DFS postorder,
+# outcomes are the results of the leaves reachable from the state, None unless all of them are before the state
+def shortcut(g, current_state, results, before, outcomes):
+    # can set results if all neighbours are contained
+    if len(before) == g.out_degree(current_state):
+        neighbour_results = set(results[n] for n in before)
+        if len(neighbour_results) == 1:
+            return neighbour_results.pop()
+
+    # can set result by reachable leaves
+    if outcomes is not None and len(outcomes) == 1:
+        return next(iter(outcomes))
+    return None
+
+# Results of the leaves reachable from the states, computed bottom-up over the condensation of g in one pass
+# Returns per state the set of results of the reachable leaves (the state itself excluded), or None if one of
+# these leaves is after the state in the DFS postorder (as in the sequential processing, its result is not yet known)
+def leaf_outcomes(g, condensation, results, position):
+    mapping = condensation.graph['mapping']
+    # every leaf is a component of its own
+    leaf_results = {mapping[s] : results[s] for s in g if g.out_degree(s) == 0}
+    leaf_positions = {mapping[s] : position[s] for s in g if g.out_degree(s) == 0}
+    outcomes = {}
+    last = {} # per component: largest postorder position of its reachable leaves
+    for c in reversed(list(nx.topological_sort(condensation))):
+        outcomes[c] = frozenset()
+        last[c] = -1
+        for d in condensation[c]:
+            outcomes[c] |= outcomes[d]
+            last[c] = max(last[c], last[d])
+            if d in leaf_results:
+                outcomes[c] |= {leaf_results[d]}
+                last[c] = max(last[c], leaf_positions[d])
+    return {s : outcomes[mapping[s]] if last[mapping[s]] < position[s] else None for s in g}
 
 # Computes mapping R from alg. 1
 # Return results too for easier handling
-def query(g, query_path):
+# The leaves are verified first, their results are propagated bottom-up over the strongly connected components
+# (a state only uses them if all its reachable leaves are before it in the DFS postorder); afterwards a state
+# is scheduled as soon as its neighbours before it in the DFS postorder are known, the states not decided by the shortcuts are verified concurrently by a pool of args.workers workers.
+# The results equal the sequential processing in DFS postorder
+# In batched mode, all states that become ready at the same time are verified by one job
+# With previous results (of another unrolling factor), the results of the states reaching no cycle are reused:
+# their sub-games are acyclic and do not change with the unrolling factor
+# The states whose query exceeded the timeout are collected in timed_out
+def query(g, query_path, previous = None):
     # partial graph implications, per activity
     results = {}
+    timed_out.clear()
     
     assert('start' in g)
-    dfs_numbers = {}
-
-    for n,i in zip(nx.dfs_postorder_nodes(g, 'start'), range(len(g.nodes)-1)):
-        dfs_numbers[i] = n
-    dfs_numbers[len(g.nodes)-1] = 'start'
-
-    for i in range(len(g.nodes)):
-    #for a in g.nodes:
-        assert(i in dfs_numbers)
-        current_state = dfs_numbers[i]
-
-        sub_nodes = set()
-        sub_nodes.update(set(list(nx.descendants(g, current_state))))
-        sub_nodes.add(current_state) # cant assume that all sub_nodes are contained due to loops
-
-        all_neighbours_contained = True
-        neighbour_results = []
-        for n in g[current_state]:
-            if n not in results:
-                all_neighbours_contained = False
-                break
-            neighbour_results.append(results[n])
-
-        all_leaves_computed = True
-        leave_results = []
-        for s in sub_nodes:
-            if g.out_degree(s) == 0 and s != current_state:
-                if s not in results:
-                    all_leaves_computed = False
-                    break
-                leave_results.append(results[s])
-        
-        # can set results if all neighbours are contained
-        if all_neighbours_contained and len(set(neighbour_results))==1:
-            results[current_state] =  neighbour_results[0]# write to assign result if determined
-            g.nodes[current_state]["positive_guarantee"] = neighbour_results[0]
-            continue
-        
-        # can set result by reachable leaves
-        if all_leaves_computed and len(set(leave_results)) == 1:
-            results[current_state] = leave_results[0]
-            g.nodes[current_state]["positive_guarantee"] = leave_results[0]
-            continue
-
-        """
-        states = [a]
-
-        sub_nodes = set()
-        for s in states:
-            sub_nodes.update(set(list(nx.descendants(g, s))))
-            sub_nodes.add(s)
-        if len(sub_nodes) > args.threshold_reachable_nodes: # execute only on nodes with less than threshold descendants for better performance
-            continue
-
-        """
-        subgraph = nx.subgraph(g, sub_nodes)
-        subgraph = nx.DiGraph(subgraph)
-
-        # add start node to subgraph
-        start_nodes = []
-        for n in subgraph.nodes:
-            if subgraph.in_degree(n) == 0:
-                start_nodes.append(n)
-        for n in start_nodes:
-            subgraph.add_edge("start", n)
-            subgraph["start"][n]["controllable"] = True
-            subgraph["start"][n]["cost"] = 0
-        # if initial node lies on cycle, per default set as start node
-        if "start" not in subgraph.nodes:
-            subgraph.add_edge("start", current_state)
-            subgraph["start"][current_state]["controllable"] = True
-            subgraph["start"][current_state]["cost"] = 0
-
-        if args.debug:
-            nx.write_gexf(subgraph, args.output+"test.gexf")
-            to_uppaal(subgraph, args.output+'bpi2017subgraph.xml')
-        target = [s for s in subgraph.nodes if "positive" in s or "negative" in s]
-        subgraph_unrolled = unroll(subgraph, "start", target, args.unrolling_factor)
-        positives = []
-        for s in subgraph_unrolled.nodes:
-            if "positive" in s:
-                positives.append(s)
-        #assert(len(positives) <= 1)
-        to_uppaal(subgraph_unrolled, args.output+'bpi2017subgraph.xml')
-        out = subprocess.Popen([args.uppaal_stratego, args.output+'bpi2017subgraph.xml', query_path], stdout=subprocess.PIPE)
-        result = "is satisfied" in str(out.communicate()[0])
-        results[current_state] = result
-
-        g.nodes[current_state]["positive_guarantee"] = result
-    
+    order = list(nx.dfs_postorder_nodes(g, 'start'))
+    assert(len(order) == len(g.nodes) and order[-1] == 'start')
+    position = {order[i] : i for i in range(len(order))}
+
+    condensation = nx.condensation(g)
+    mapping = condensation.graph['mapping']
+    # states left by the strongly connected components, all of them are before the states of the component
+    exits = {c : set() for c in condensation}
+    for s in g:
+        exits[mapping[s]].update(n for n in g[s] if mapping[n] != mapping[s])
 
+    # neighbours before the state in the postorder, the state waits for their results
+    # and, if decided states are collapsed, for the non-leaf states leaving its component
+    before = {s : [n for n in g[s] if position[n] < position[s]] for s in g}
+    dependencies = {}
+    for s in g:
+        dependencies[s] = set(before[s])
+        if args.collapse_solved:
+            dependencies[s].update(n for n in exits[mapping[s]] if g.out_degree(n) > 0)
+    waiting = {s : len(dependencies[s]) for s in g}
+    dependents = {s : [] for s in g}
+    for s in g:
+        for n in dependencies[s]:
+            dependents[n].append(s)
+
+    outcomes = None
+    avoided = 0
+    running = {}
+
+    def assign(state, result):
+        results[state] = result # write to assign result if determined
+        g.nodes[state]["positive_guarantee"] = result
+        for s in dependents[state]:
+            waiting[s] -= 1
+            if waiting[s] == 0 and outcomes is not None:
+                ready.append(s)
+
+    reused = []
+    if previous is not None:
+        acyclic = reachability.acyclic_states(reachability.closure(g))
+        reused = [s for s in order if s in acyclic]
+        for s in reused:
+            assign(s, previous[s])
+    leaves = [s for s in order if g.out_degree(s) == 0 and s not in results]
+    ready = deque(leaves)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers = args.workers) as pool:
+        while ready or running or outcomes is None:
+            batch = []
+            while ready:
+                current_state = ready.popleft()
+                if outcomes is not None:
+                    result = shortcut(g, current_state, results, before[current_state], outcomes[current_state])
+                    if result is not None:
+                        avoided += 1
+                        assign(current_state, result)
+                        continue
+
+                if args.collapse_solved:
+                    members = condensation.nodes[mapping[current_state]]['members']
+                    decided = {n : results[n] for n in exits[mapping[current_state]] if g.out_degree(n) > 0}
+                    subgraph = sub_game(g, current_state, members | exits[mapping[current_state]], decided)
+                else:
+                    subgraph = sub_game(g, current_state, nx.descendants(g, current_state) | {current_state})
+                if args.debug:
+                    nx.write_gexf(subgraph, args.output+"test.gexf")
+                    to_uppaal(subgraph, args.output+'bpi2017subgraph.xml', model_layout(), args.debug)
+                batch.append((current_state, subgraph))
+                if not args.batched:
+                    running[pool.submit(solve_states, batch, query_path)] = batch
+                    batch = []
+            if batch:
+                running[pool.submit(solve_states, batch, query_path)] = batch
+
+            if running:
+                done, _ = concurrent.futures.wait(running, return_when = concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    candidates = running.pop(future)
+                    for (current_state, subgraph), result in zip(candidates, future.result()):
+                        assign(current_state, result)
+
+            # all leaves known: propagate their results and release the remaining states
+            if outcomes is None and not running:
+                outcomes = leaf_outcomes(g, condensation, results, position)
+                ready.extend(s for s in order if s not in results and waiting[s] == 0)
+
+    assert(len(results) == len(g.nodes))
+    print("Solver calls:", len(g.nodes)-avoided-len(reused), "- avoided by shortcuts:", avoided)
+    if previous is not None:
+        print("Warm start: reused", len(reused), "of", len(g.nodes), "results")
     return g, results
 
 # Function to compute clusters for decision boundary
 def reachable_cluster(g, results):
     pos_cluster = []
     neg_cluster = []
-    g_copy = copy.deepcopy(g)
+    agreeing = reachability.agreeing_states(reachability.closure(g), results)
     for s in g:
-        subgraph = nx.subgraph(g, set(list(nx.descendants(g, s))))
-        subgraph = nx.DiGraph(subgraph)
-        nodes = [s for s in subgraph]
-        sub_results = [results[n] for n in results if n in nodes]
         g.nodes[s]['reducible'] = False
-        if len(set(sub_results))<2:
+        if s in agreeing:
             g.nodes[s]['reducible'] = True
             # sub_results has size 0 or 1: 0 if end node, 1 else
             if results[s]:
@@ -324,100 +625,121 @@ def reachable_cluster(g, results):
             else:
                 neg_cluster.append(s)
 
-    for s in pos_cluster:
-        g_copy = nx.contracted_nodes(g_copy, "pos", s)
-    for s in neg_cluster:
-        g_copy = nx.contracted_nodes(g_copy, "neg", s)
-   
-    g_copy.remove_edges_from(nx.selfloop_edges(g_copy))
+    _, db = reduction.quotient(g, [("pos", pos_cluster), ("neg", neg_cluster)], self_loops = False)
+    db = set(db)
+    clustered = set(pos_cluster) | set(neg_cluster)
 
-    for s in g_copy.nodes:
-        
-        pos = False
-        neg = False
-        if s not in g:
+    for s in g:
+        if s in clustered:
             # after contraction
             continue
-        for n in g_copy[s]:
-            if "pos" in n:
-                pos = True
-            if "neg" in n:
-                neg = True
-        
-        if pos and neg and len(g_copy[s]) == 2:
-            assert(s in g.nodes)
+        if s in db:
             g.nodes[s]['decision_boundary'] = True
             #g.nodes[s]['viz'] = {'color': {'r': 0, 'g': 0, 'b':255, 'a': 0}}
             g.nodes[s]['color'] = "blue"
             g.nodes[s]['shape'] = "box"
             g.nodes[s]['viz'] = {'color': {'r': 0, 'g': 0, 'b': 255, 'a': 0}}
         else:
-            assert(s in g.nodes)
             g.nodes[s]['decision_boundary'] = False
     
     return g
 
 def game_db(g, results):
-    g_copy = copy.deepcopy(g)
     positive_cluster = []
     for s in results:
         if results[s]:
-            g_copy.nodes[s]['color'] = "green"
             positive_cluster.append(s)
 
     # attempted merge:
-    negative_cluster = []
-    for s in g_copy.nodes:
-        reachable = set(list(nx.descendants(g_copy, s)))
-        reaches_pos = False
-        for neighbour in reachable:
-            if "pos" in neighbour:
-                reaches_pos = True
-        if "pos" in s:
-            reaches_pos = True
-        if not reaches_pos:
-            g_copy.nodes[s]['color'] = "red"
-            negative_cluster.append(s)
-    for s in negative_cluster:
-        g_copy = nx.contracted_nodes(g_copy, "neg", s)
-    for s in positive_cluster:
-        g_copy = nx.contracted_nodes(g_copy, "pos", s)
-
-    db = []
+    reaches_pos = reachability.reaching_states(reachability.closure(g), [s for s in g if "pos" in s])
+    negative_cluster = [s for s in g if s not in reaches_pos]
+    _, db = reduction.quotient(g, [("neg", negative_cluster), ("pos", positive_cluster)])
+
     for s in g:
-        pos = False
-        neg = False
         g.nodes[s]['decision_boundary'] = False
         g.nodes[s]['positive_guarantee'] = results[s]
-        if s in g_copy:
-            for n in g_copy[s]:
-                if "pos" in n:
-                    pos = True
-                if "neg" in n:
-                    neg = True
-            if pos and neg and len(g_copy[s]) == 2:
-                db.append(s)
-                g.nodes[s]['decision_boundary'] = True
-                g.nodes[s]['color'] = "blue"
-                g.nodes[s]['shape'] = "box"
-                g.nodes[s]['viz'] = {'color': {'r': 0, 'g': 0, 'b': 255, 'a': 0}}
+    for s in db:
+        g.nodes[s]['decision_boundary'] = True
+        g.nodes[s]['color'] = "blue"
+        g.nodes[s]['shape'] = "box"
+        g.nodes[s]['viz'] = {'color': {'r': 0, 'g': 0, 'b': 255, 'a': 0}}
 
     return g, db
 
-# Load graph
-g = nx.read_gexf(args.input)
-
-# Compute single results
-g, results = query(g, args.query)
-
-# Compute decision boundary
-if not args.static:
-    g, db = game_db(g, results)
-else:
-    #g, db = db_shortcut(g)
-    g = reachable_cluster(g, results)
+# Results of the states of a game annotated by decision_boundary(), None if one of its queries exceeded the timeout:
+# the results then depend on the machine load and are not reused
+def previous_results(g):
+    if any(g.nodes[s].get('timed_out', False) for s in g):
+        return None
+    return {s : g.nodes[s]['positive_guarantee'] for s in g}
+
+# Parameters of the decision boundary of the game with the configured options, recorded as graph attribute
+# 'decision_boundary_parameters' of the annotated game: the options it is stored under (see store_parameters) and a hash of the game
+def boundary_parameters(g):
+    return dict(store_parameters(vars(args)), game = verdict_cache.game_hash(g, args.query))
+
+# Checks that the decision boundary to warm start from was computed for the same game with the same options,
+# except the unrolling factor; g is the game before it is annotated
+def check_warm_start(previous_g, g):
+    recorded = previous_g.graph.get('decision_boundary_parameters')
+    expected = boundary_parameters(g)
+    if recorded is None or any(recorded.get(p) != expected[p] for p in expected if p != "unrolling_factor"):
+        raise ValueError("the decision boundary to warm start from is not computed for the same game with the same options (query, backend, -s, -cs, -qt)")
+
+# Computes the results of the states and the decision boundary of the game with the configured options
+# previous are the results for another unrolling factor to warm start from (see query), the game is annotated in place
+def decision_boundary(g, previous = None):
+    assert(args.backend == "attractor" or args.uppaal_stratego is not None)
+    assert(previous is None or set(previous) == set(g.nodes))
+    if args.backend != "verifyta" and not game_solver.solves_query(args.query):
+        raise ValueError("the backend '" + args.backend + "' only decides '" + game_solver.QUERY + "', not the query of " + args.query)
+    if args.batched and args.backend != "attractor":
+        batch_formula(args.query) # rejects query files the batched model cannot combine
+
+    parameters = boundary_parameters(g)
+
+    # Compute single results
+    g, results = query(g, args.query, previous)
+    g.graph['decision_boundary_parameters'] = parameters
+    for s in g:
+        g.nodes[s]['timed_out'] = s in timed_out
 
-name = args.output+"DECB"+ args.input.split("/")[-1].split(".")[0].split("GAME")[-1] + "_unrolling_factor:" + str(args.unrolling_factor) + "_" + ".gexf"
+    # Compute decision boundary
+    if not args.static:
+        g, db = game_db(g, results)
+    else:
+        #g, db = db_shortcut(g)
+        g = reachable_cluster(g, results)
+    return g
 
-nx.write_gexf(g, name)
-print("Generated:", name)
\ No newline at end of file
+def output_name(output, input, unrolling_factor, file_format = graph_format.DEFAULT_FORMAT):
+    return output+"DECB"+ input.split("/")[-1].split(".")[0].split("GAME")[-1] + "_unrolling_factor:" + str(unrolling_factor) + "_" + graph_format.EXTENSIONS[file_format]
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    def compute():
+        # Load graph
+        g = graph_format.read_graph(args.input)
+
+        previous = None
+        if args.warm_start is not None:
+            previous_g = graph_format.read_graph(args.warm_start)
+            check_warm_start(previous_g, g)
+            previous = previous_results(previous_g)
+            if previous is None:
+                print("Warm start: the given decision boundary has timed out queries, its results are not reused")
+        return decision_boundary(g, previous)
+
+    # decision boundaries with timed out queries depend on the machine load and are not stored,
+    # a warm started one is only reused with the same decision boundary to warm start from
+    input_key = None if args.no_store else artifact_store.file_hash(args.input)
+    parameters = store_parameters(vars(args))
+    if args.warm_start is not None:
+        parameters["warm_start"] = artifact_store.file_hash(args.warm_start)
+    g, _ = artifact_store.cached("decision_boundary", input_key, parameters, compute, lambda g: not timed_out)
+
+    name = output_name(args.output, args.input, args.unrolling_factor, args.format)
+
+    graph_format.write_graph(g, name)
+    print("Generated:", name)
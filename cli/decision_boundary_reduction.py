@@ -1,5 +1,8 @@
 import argparse
-import networkx as nx
+import reduction
+import reachability
+import graph_format
+import artifact_store
 
 parser = argparse.ArgumentParser(
                     prog = 'decision_boundary_reduction',
@@ -7,49 +10,38 @@ parser = argparse.ArgumentParser(
 parser.add_argument('input', help = "Input model")
 parser.add_argument('output', help = "Output path for reduced game") 
 parser.add_argument('-s', '--static', help = "Game decision boundary with neglecting game properties (static decision boundary); default = False", type = bool, default = False) 
-
-args = parser.parse_args()
+parser.add_argument('-ns', '--no_store', help = "Neither reuses nor stores the reduced game in the artifact store (see artifact_store.py); default = False", action = 'store_true') 
+parser.add_argument('-f', '--format', help = "File format of the written reduced game: 'gexf' (e.g. for Gephi and the notebooks) or 'binary' (compact, read via memory map, see graph_format.py); default = gexf", default = "gexf", choices = ["binary", "gexf"]) 
 
 # Uses the decision boundary computation as model reduction
-def db_reduction(g):
+def db_reduction(g, static = False):
 
     pos_cluster = []
     neg_cluster = []
 
-    if not args.static:
+    if not static:
         for s in g.nodes:
             if g.nodes[s]['positive_guarantee']:
                 g.nodes[s]['color'] = "green"
                 pos_cluster.append(s)
 
+        reaches_pos = reachability.reaching_states(reachability.closure(g), [s for s in g if "pos" in s])
         for s in g.nodes:
-            reachable = set(list(nx.descendants(g, s)))
-            reaches_pos = False
-            for neighbour in reachable:
-                if "pos" in neighbour:
-                    reaches_pos = True
-            if "pos" in s:
-                reaches_pos = True
-            if not reaches_pos:
+            if s not in reaches_pos:
                 g.nodes[s]['color'] = "red"
                 neg_cluster.append(s)
     else:
+        values = {n : g.nodes[n]["positive_guarantee"] for n in g if 'positive_guarantee' in g.nodes[n]}
+        agreeing = reachability.agreeing_states(reachability.closure(g), values)
         for s in g:
-            subgraph = nx.subgraph(g, set(list(nx.descendants(g, s))))
-            subgraph = nx.DiGraph(subgraph)
-            nodes = [s for s in subgraph]
-            sub_results = [g.nodes[n]["positive_guarantee"] for n in nodes if 'positive_guarantee' in g.nodes[n]]
-            if len(set(sub_results))<2:
+            if s in agreeing:
                 # sub_results has size 0 or 1: 0 if end node, 1 else
                 if g.nodes[s]["positive_guarantee"]:
                     pos_cluster.append(s)
                 else:
                     neg_cluster.append(s)
 
-    for s in pos_cluster:
-        g = nx.contracted_nodes(g, "pos", s)
-    for s in neg_cluster:
-        g = nx.contracted_nodes(g, "neg", s)
+    g, _ = reduction.quotient(g, [("pos", pos_cluster), ("neg", neg_cluster)], self_loops = False)
     g.nodes['pos']['decision_boundary'] = False
     g.nodes['neg']['decision_boundary'] = False
     g.nodes['pos']['positive_guarantee'] = True
@@ -65,21 +57,30 @@ def db_reduction(g):
         if "final" not in g.nodes[s]:
              g.nodes[s]["final"] = False
 
-    g.remove_edges_from(nx.selfloop_edges(g))
-   
-
     return g
 
-# Load graph
-g = nx.read_gexf(args.input)
+def output_name(output, input, file_format = graph_format.DEFAULT_FORMAT):
+    return output + input.split("/")[-1].split(".")[0] + "reduced:True" + graph_format.EXTENSIONS[file_format]
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    def reduce():
+        # Load graph
+        g = graph_format.read_graph(args.input)
+
+        #g = reduce_graph(g)
+        g = db_reduction(g, args.static)
 
-#g = reduce_graph(g)
-g = db_reduction(g)
+        # add graph attributes
+        g.graph["reduced_graph"] = True
+        return g
 
-# add graph attributes
-g.graph["reduced_graph"] = True
+    # the reduced game is keyed on the content hash of the decision boundary file
+    input_key = None if args.no_store else artifact_store.file_hash(args.input)
+    g, _ = artifact_store.cached("reduction", input_key, {"static" : args.static}, reduce)
 
-print(g.graph["reduced_graph"])
-name = args.output + args.input.split("/")[-1].split(".")[0] + "reduced:True"+ ".gexf"
-nx.write_gexf(g, name)
-print("Generated:", name)
\ No newline at end of file
+    print(g.graph["reduced_graph"])
+    name = output_name(args.output, args.input, args.format)
+    graph_format.write_graph(g, name)
+    print("Generated:", name)
@@ -1,6 +1,5 @@
-import subprocess
 import argparse
-import networkx as nx
+import pipeline
 
 parser = argparse.ArgumentParser(
                     prog = 'group_execution',
@@ -11,48 +10,20 @@ parser.add_argument('activities', help = "Activities to construct game")
 parser.add_argument('uppaal_stratego', help = "Path to Uppaal Stratego's VERIFYTA")
 parser.add_argument('-hist', '--max_history', help = "Maximum sequence to be tested", type = int, required = True)
 parser.add_argument('-k', '--max_unrolling_factor', help = "Maximum Constant factor for how often every lop is unrolled", type = int, default = 1) 
-parser.add_argument('-time', '--timeout', help = "Maximum sequence to be tested", default = 180, type = int)
+parser.add_argument('-time', '--timeout', help = "Time in seconds after which the decision boundary of a history and unrolling factor is aborted, larger unrolling factors of the history are cancelled; default = 180", default = 180, type = int)
 parser.add_argument('-t', '--type', help = "Type of directly follows model: default = hist", default = "sequence", choices = ["sequence", "multiset"])
 parser.add_argument('-min_hist', '--min_history', help = "Sequence to be started with", type = int, default = 1)
 parser.add_argument('-min_k', '--min_unrolling_factor', help = "Minimum Constant factor for how often every lop is unrolled", type = int, default = 1) 
+parser.add_argument('-p', '--processes', help = "Number of (history, unrolling factor) pairs computed concurrently, each in its own process; default = 1", type = int, default = 1) 
+parser.add_argument('-table', '--table', help = "Path of the CSV table with decision boundary, its size and the timings per history and unrolling factor; default = <output>results.csv", default = None) 
+parser.add_argument('-ns', '--no_store', help = "Neither reuses nor stores process models, games and decision boundaries in the artifact store; default = False", action = 'store_true') 
+parser.add_argument('-ws', '--warm_start', help = "Reuses the results of the states reaching no cycle from the previous unrolling factor of the history, if it is finished; default = False", action = 'store_true') 
+parser.add_argument('-f', '--format', help = "File format of the written process models and games: 'gexf' (e.g. for Gephi and the notebooks) or 'binary' (compact, read via memory map, see graph_format.py); default = gexf", default = "gexf", choices = ["binary", "gexf"]) 
 
-args = parser.parse_args()
+if __name__ == "__main__":
+    args = parser.parse_args()
 
+    # the process models and games are built once, the pairs of history and unrolling factor are computed in parallel, see pipeline.py
+    rows = pipeline.sweep(args.input, args.activities, args.output, args.type, range(args.min_history, args.max_history+1), range(args.min_unrolling_factor, args.max_unrolling_factor+1), args.timeout, args.processes, not args.no_store, args.format, args.warm_start, uppaal_stratego = args.uppaal_stratego)
 
-decision_boundary = {}
-for i in range(args.min_history,args.max_history+1):
-    try: 
-        output = subprocess.check_output(["python3", "process_model.py", args.input, args.output, "-t", str(args.type), "-hist" , str(i)], timeout=args.timeout)
-        file_name = str(output).replace("\\n'", '').split("Generated: ")[-1]
-        print(file_name)
-
-        output = subprocess.check_output(["python3", "build_game.py", file_name, args.output, args.activities], timeout=args.timeout)
-        file_name = str(output).replace("\\n'", '').split("Generated: ")[-1]
-        print(file_name)
-
-        unrolled_model_name = file_name
-        for k in range(args.min_unrolling_factor,args.max_unrolling_factor+1):
-            try:
-                output = subprocess.check_output(["python3", "decision_boundary.py", unrolled_model_name, args.output, args.uppaal_stratego, "-k", str(k)], timeout=args.timeout)
-                file_name = str(output).replace("\\n'", '').split("Generated: ")[-1]
-                print(file_name)
-
-                output = subprocess.check_output(["python3", "decision_boundary_reduction.py", file_name, args.output], timeout=args.timeout)
-                file_name = str(output).replace("\\n'", '').split("Generated: ")[-1]
-                print(file_name)
-
-                g = nx.read_gexf(file_name)
-                db = [n for n in g if 'decision_boundary' in g.nodes[n] and g.nodes[n]['decision_boundary']]
-                decision_boundary[str(file_name)] = db
-            except subprocess.TimeoutExpired:
-                print("Timeout - abort further unrolling")
-                break
-
-        
-    except subprocess.TimeoutExpired:
-        print("Timeout - continue now")
-        continue
-for n in decision_boundary:
-    print(n, "(", len(decision_boundary[n]), "):")
-    for e in decision_boundary[n]:
-        print("      ", e)
\ No newline at end of file
+    pipeline.write_table(rows, args.output + "results.csv" if args.table is None else args.table)
@@ -0,0 +1,54 @@
+from collections import deque
+
+# In-process solver for the reachability games checked with QUERY (guaranteed_tool.q), other queries are not supported.
+# Edges carry the attribute 'controllable', positive outcome states are the goal (as in to_uppaal: "positive" in the name).
+# A state is winning for the controller if
+#   - it is a goal state, or
+#   - all uncontrollable successors are winning (the environment may move first) and
+#     a controllable successor is winning, or there are no controllable edges (the environment has to move).
+# States without outgoing edges that are no goal are losing.
+
+QUERY = "control: A<> reached_positive"
+
+def is_goal(s):
+    return "positive" in str(s)
+
+# Whether the query file checks the property decided by the solver, QUERY (with an optional 'strategy name =' prefix)
+def solves_query(query_path):
+    with open(query_path) as f:
+        query = f.read()
+    return "".join(query.split("=")[-1].split()) == "".join(QUERY.split())
+
+# Computes the controller's attractor of the goal states by backward propagation, linear in the size of the game
+# Returns the set of winning states
+def attractor(g):
+    pending = {} # per state: number of uncontrollable edges not yet known to lead into the attractor
+    controlled = {} # per state: a controllable edge leads into the attractor, or there are no controllable edges
+    for s in g:
+        pending[s] = 0
+        controlled[s] = True
+        for t in g[s]:
+            if g[s][t]['controllable']:
+                controlled[s] = False
+            else:
+                pending[s] += 1
+
+    winning = set(s for s in g if is_goal(s))
+    queue = deque(winning)
+    while queue:
+        t = queue.popleft()
+        for s in g.predecessors(t):
+            if s in winning:
+                continue
+            if g[s][t]['controllable']:
+                controlled[s] = True
+            else:
+                pending[s] -= 1
+            if pending[s] == 0 and controlled[s]:
+                winning.add(s)
+                queue.append(s)
+    return winning
+
+# Decides the game from the given initial state
+def solve(g, initial = "start"):
+    return initial in attractor(g)
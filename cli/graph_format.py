@@ -0,0 +1,191 @@
+import json
+import argparse
+import numpy as np
+import networkx as nx
+
+# Compact binary format for the graphs exchanged between the stages, alternative to .gexf.
+# Nodes are numbered in graph order, edges are stored as arrays of source and target numbers.
+# Every node and edge attribute is one typed column (see log_cache.py): bool, int and float values as arrays,
+# strings (also the node names and actions) as index into one string table of the graph, other values
+# (e.g. the 'viz' dicts) as JSON in the string table; a presence array marks the nodes/edges having the attribute.
+# File layout: magic, length of the JSON header, header (graph attributes, columns and the offsets of their arrays),
+# the arrays aligned to 8 bytes. The arrays are read through a memory map.
+# Graphs read from .gexf are written and read back without loss, the .gexf export of both is identical.
+# GEXF has no graph attributes besides its own ones, the other graph attributes are kept as JSON in the name of the graph.
+
+MAGIC = b"BPIGRAPH"
+FORMAT_VERSION = 1
+ALIGNMENT = 8
+EXTENSIONS = {"binary" : ".bgraph", "gexf" : ".gexf"}
+DEFAULT_FORMAT = "gexf" # of the written files, the artifact store always uses the binary format
+GEXF_GRAPH_ATTRIBUTES = ["name", "mode", "node_default", "edge_default", "start", "end"]
+GRAPH_ATTRIBUTES_NAME = "graph attributes: "
+
+parser = argparse.ArgumentParser(
+                    prog = 'graph_format',
+                    description = "Converts graphs between the binary format and .gexf, the format is given by the file extension (.bgraph or .gexf).",)
+parser.add_argument('input', help = "Input graph")
+parser.add_argument('output', help = "Output graph")
+
+def python_value(v):
+    return v.item() if isinstance(v, np.generic) else v
+
+def column_kind(values):
+    types = set(type(v).__name__ for v in values if v is not None)
+    if len(types) == 1 and next(iter(types)) in ["bool", "int", "float", "str"]:
+        return types.pop()
+    return "json" if types else "str"
+
+# Converts a list of values (None if missing) into typed arrays, strings are added to the table
+def to_column(values, table):
+    values = [python_value(v) for v in values]
+    kind = column_kind(values)
+    present = np.array([v is not None for v in values], dtype=np.uint8)
+    if kind == "str":
+        codes = np.array([table.setdefault(v, len(table)) if v is not None else -1 for v in values], dtype=np.int64)
+    elif kind == "json":
+        codes = np.array([table.setdefault(json.dumps(v), len(table)) if v is not None else -1 for v in values], dtype=np.int64)
+    else:
+        dtype = {"int": np.int64, "float": np.float64, "bool": np.uint8}[kind]
+        codes = np.array([v if v is not None else 0 for v in values], dtype=dtype)
+    return kind, {"present": present, "values": codes}
+
+# Inverse of to_column, returns the python values (None if missing)
+def from_column(kind, column, strings):
+    present = column["present"].tolist()
+    values = column["values"].tolist()
+    if kind == "str":
+        values = [strings(c) if c >= 0 else None for c in values]
+    elif kind == "json":
+        values = [json.loads(strings(c)) if c >= 0 else None for c in values]
+    elif kind == "bool":
+        values = [bool(v) for v in values]
+    return [v if p else None for v, p in zip(values, present)]
+
+# Columns of the attributes of the items and the attribute order per item, as index into the table of key orders
+def attribute_columns(items, table):
+    keys = list(dict.fromkeys(k for item in items for k in item))
+    positions = {keys[i] : i for i in range(len(keys))}
+    orders = {}
+    order = np.array([orders.setdefault(tuple(positions[k] for k in item), len(orders)) for item in items], dtype=np.int64)
+    return {k : to_column([item.get(k) for item in items], table) for k in keys}, order, [list(o) for o in orders]
+
+def write_binary(g, path):
+    assert(not g.is_multigraph())
+    table = {}
+    nodes = list(g)
+    number = {n : i for i, n in enumerate(nodes)}
+    edges = list(g.edges(data = True))
+
+    name_kind, names = to_column(nodes, table)
+    columns = {"names" : (name_kind, names)}
+    arrays = {"source" : np.array([number[s] for s, t, data in edges], dtype=np.int64), "target" : np.array([number[t] for s, t, data in edges], dtype=np.int64)}
+    orders = {}
+    for level, items in [("node", [data for n, data in g.nodes(data = True)]), ("edge", [data for s, t, data in edges])]:
+        level_columns, arrays[level + "/order"], orders[level] = attribute_columns(items, table)
+        for k, column in level_columns.items():
+            columns[level + ":" + k] = column
+    for name, (kind, column) in columns.items():
+        for field in column:
+            arrays[name + "/" + field] = column[field]
+    encoded = [s.encode() for s in table]
+    arrays["strings/offsets"] = np.cumsum([0] + [len(s) for s in encoded], dtype=np.int64)
+    arrays["strings/data"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = [array.dtype.str, offset, len(array)]
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header = json.dumps({"version" : FORMAT_VERSION, "directed" : g.is_directed(), "graph" : g.graph, "nodes" : len(nodes), "edges" : len(edges),
+        "columns" : {name : kind for name, (kind, column) in columns.items()}, "orders" : orders, "arrays" : layout}).encode()
+    header += b" " * (-(len(MAGIC) + 8 + len(header)) % ALIGNMENT)
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.array([len(header)], dtype="<u8").tobytes())
+        f.write(header)
+        for name, array in arrays.items():
+            data = array.tobytes()
+            f.write(data + b"\0" * (-len(data) % ALIGNMENT))
+
+def read_binary(path):
+    buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    if bytes(buffer[:len(MAGIC)]) != MAGIC:
+        raise ValueError("not a binary graph: " + path)
+    length = int(buffer[len(MAGIC):len(MAGIC)+8].view("<u8")[0])
+    start = len(MAGIC) + 8
+    header = json.loads(bytes(buffer[start:start+length]).decode())
+    if header["version"] != FORMAT_VERSION:
+        raise ValueError("unsupported binary graph version: " + path)
+    start += length
+    arrays = {}
+    for name, (dtype, offset, count) in header["arrays"].items():
+        dtype = np.dtype(dtype)
+        arrays[name] = buffer[start+offset:start+offset+count*dtype.itemsize].view(dtype)
+
+    offsets = arrays["strings/offsets"].tolist()
+    data = bytes(arrays["strings/data"])
+    decoded = {}
+    def strings(c):
+        if c not in decoded:
+            decoded[c] = data[offsets[c]:offsets[c+1]].decode()
+        return decoded[c]
+    def column(name):
+        return from_column(header["columns"][name], {field : arrays[name + "/" + field] for field in ["present", "values"]}, strings)
+
+    g = nx.DiGraph() if header["directed"] else nx.Graph()
+    g.graph.update(header["graph"])
+    nodes = column("names")
+    attributes = {}
+    for level in ["node", "edge"]:
+        keys = [name[len(level)+1:] for name in header["columns"] if name.startswith(level + ":")]
+        values = [column(level + ":" + k) for k in keys]
+        orders = header["orders"][level]
+        attributes[level] = [{keys[k] : values[k][i] for k in orders[order]} for i, order in enumerate(arrays[level + "/order"].tolist())]
+    g.add_nodes_from(zip(nodes, attributes["node"]))
+    g.add_edges_from((nodes[s], nodes[t], data) for s, t, data in zip(arrays["source"].tolist(), arrays["target"].tolist(), attributes["edge"]))
+    return g
+
+# Format of the graph file, binary graphs are recognized by their magic bytes
+def file_format(path):
+    with open(path, "rb") as f:
+        return "binary" if f.read(len(MAGIC)) == MAGIC else "gexf"
+
+def read_graph(path):
+    if file_format(path) == "binary":
+        return read_binary(path)
+    return read_gexf(path)
+
+# Writes the graph in the format given by the extension of the path, .gexf or binary otherwise
+def write_graph(g, path):
+    if path.endswith(EXTENSIONS["gexf"]):
+        write_gexf(g, path)
+    else:
+        write_binary(g, path)
+
+def write_gexf(g, path):
+    attributes = {k : v for k, v in g.graph.items() if k not in GEXF_GRAPH_ATTRIBUTES}
+    if not attributes:
+        nx.write_gexf(g, path)
+        return
+    assert("name" not in g.graph)
+    original = dict(g.graph)
+    g.graph.clear()
+    g.graph.update({k : v for k, v in original.items() if k in GEXF_GRAPH_ATTRIBUTES}, name = GRAPH_ATTRIBUTES_NAME + json.dumps(attributes))
+    try:
+        nx.write_gexf(g, path)
+    finally:
+        g.graph.clear()
+        g.graph.update(original)
+
+def read_gexf(path):
+    g = nx.read_gexf(path)
+    if g.graph.get("name", "").startswith(GRAPH_ATTRIBUTES_NAME):
+        g.graph.update(json.loads(g.graph.pop("name")[len(GRAPH_ATTRIBUTES_NAME):]))
+    return g
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    write_graph(read_graph(args.input), args.output)
+    print("Generated:", args.output)
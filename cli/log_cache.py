@@ -0,0 +1,133 @@
+import os
+import datetime
+import numpy as np
+from pm4py.objects.log.importer.xes import importer as xes_importer
+from pm4py.objects.log.obj import EventLog, Trace, Event
+import artifact_store
+
+# Persistent cache for parsed event logs.
+# Logs are keyed on the content hash of the .xes file and stored column-wise in a binary .npz file:
+# trace boundaries, one column per trace and event attribute (strings via string table, timestamps as integers)
+# The cache directory is set by the environment variable BPI_GAMES_CACHE, default: ~/.cache/bpi_games/logs
+
+CACHE_VERSION = 2
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+def cache_directory():
+    return os.environ.get("BPI_GAMES_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "bpi_games", "logs"))
+
+# Converts a list of attribute values (None if missing) into typed arrays, returns None for unsupported types
+def to_column(values):
+    present = np.array([v is not None for v in values], dtype=bool)
+    types = set(type(v) for v in values if v is not None)
+    if len(types) > 1:
+        return None
+    kind = types.pop().__name__ if types else "str"
+    if kind == "str":
+        table = {}
+        codes = [table.setdefault(v, len(table)) if v is not None else -1 for v in values]
+        return {"kind": kind, "present": present, "values": np.array(codes, dtype=np.int64), "table": np.array(list(table), dtype=str)}
+    if kind == "datetime":
+        # microseconds since epoch and utc offset in seconds, timezone-naive values are stored with their own flag
+        naive = np.array([v is not None and v.tzinfo is None for v in values], dtype=bool)
+        micro = [(v.replace(tzinfo=datetime.timezone.utc) if v.tzinfo is None else v) - EPOCH if v is not None else datetime.timedelta(0) for v in values]
+        offsets = [int(v.utcoffset().total_seconds()) if v is not None and v.tzinfo is not None else 0 for v in values]
+        return {"kind": kind, "present": present, "values": np.array([m // datetime.timedelta(microseconds=1) for m in micro], dtype=np.int64), "offsets": np.array(offsets, dtype=np.int64), "naive": naive}
+    if kind in ["int", "float", "bool"]:
+        dtype = {"int": np.int64, "float": np.float64, "bool": bool}[kind]
+        return {"kind": kind, "present": present, "values": np.array([v if v is not None else 0 for v in values], dtype=dtype)}
+    return None
+
+# Inverse of to_column, returns the python values (None if missing)
+def from_column(column):
+    kind = column["kind"]
+    present = column["present"].tolist()
+    if kind == "str":
+        table = column["table"].tolist()
+        values = [table[c] if c >= 0 else None for c in column["values"].tolist()]
+    elif kind == "datetime":
+        timezones = {}
+        values = []
+        for micro, offset, naive in zip(column["values"].tolist(), column["offsets"].tolist(), column["naive"].tolist()):
+            v = EPOCH + datetime.timedelta(microseconds=micro)
+            if naive:
+                v = v.replace(tzinfo=None)
+            else:
+                if offset not in timezones:
+                    timezones[offset] = datetime.timezone(datetime.timedelta(seconds=offset))
+                v = v.astimezone(timezones[offset])
+            values.append(v)
+    else:
+        values = column["values"].tolist()
+    return [v if p else None for v, p in zip(values, present)]
+
+# Writes the log in columnar form, returns False if the log contains unsupported attribute types
+def write_columns(log, path):
+    arrays = {"version": np.array([CACHE_VERSION]), "offsets": np.cumsum([0] + [len(trace) for trace in log], dtype=np.int64)}
+    for level, items in [("trace", [trace.attributes for trace in log]), ("event", [event for trace in log for event in trace])]:
+        keys = list(dict.fromkeys(k for item in items for k in item))
+        for i in range(len(keys)):
+            column = to_column([item.get(keys[i]) for item in items])
+            if column is None:
+                return False
+            arrays[level + "_keys_" + str(i)] = np.array([keys[i]], dtype=str)
+            for field in column:
+                arrays[level + "_" + field + "_" + str(i)] = np.array([column[field]], dtype=str) if field == "kind" else column[field]
+        # attribute order per item, as index into the table of key orders
+        positions = {keys[i] : i for i in range(len(keys))}
+        orders = {}
+        arrays[level + "_order"] = np.array([orders.setdefault(tuple(positions[k] for k in item), len(orders)) for item in items], dtype=np.int64)
+        arrays[level + "_orders"] = np.array([",".join(str(k) for k in order) for order in orders], dtype=str)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp" + str(os.getpid())
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path) # atomic, concurrent runs never read partial files
+    return True
+
+def read_level(data, level):
+    columns = {}
+    i = 0
+    while level + "_keys_" + str(i) in data:
+        prefix = level + "_"
+        fields = {"kind": str(data[prefix + "kind_" + str(i)][0])}
+        for field in ["present", "values", "table", "offsets", "naive"]:
+            if prefix + field + "_" + str(i) in data:
+                fields[field] = data[prefix + field + "_" + str(i)]
+        columns[str(data[prefix + "keys_" + str(i)][0])] = from_column(fields)
+        i += 1
+    keys = list(columns)
+    values = [columns[key] for key in keys]
+    orders = [[int(k) for k in order.split(",")] if order else [] for order in data[level + "_orders"].tolist()]
+    items = []
+    for index, order in enumerate(data[level + "_order"].tolist()):
+        items.append({keys[k] : values[k][index] for k in orders[order]})
+    return items
+
+# Reads a log written by write_columns into pm4py objects
+def read_columns(path):
+    with np.load(path, allow_pickle=False) as data:
+        assert(int(data["version"][0]) == CACHE_VERSION)
+        offsets = data["offsets"].tolist()
+        trace_attributes = read_level(data, "trace")
+        events = read_level(data, "event")
+    log = EventLog()
+    for i in range(len(offsets)-1):
+        log.append(Trace([Event(e) for e in events[offsets[i]:offsets[i+1]]], attributes = trace_attributes[i]))
+    return log
+
+# Path of the cache entry of the given .xes file
+def cache_path(path):
+    return os.path.join(cache_directory(), artifact_store.file_hash(path) + ".npz")
+
+# Loads an event log, the .xes file is only imported on a cache miss
+def load_log(path):
+    cached = cache_path(path)
+    if os.path.exists(cached):
+        try:
+            return read_columns(cached)
+        except (OSError, ValueError, KeyError, AssertionError):
+            pass # corrupt or outdated cache entry, import again
+    log = xes_importer.apply(path)
+    write_columns(log, cached)
+    return log
@@ -1,7 +1,7 @@
 import argparse
-import pandas as pd
-import pm4py
-from pm4py.objects.log.importer.xes import importer as xes_importer
+import log_cache
+import xes_stream
+import xes_writer
 import copy
 from collections import Counter
 from sklearn import mixture
@@ -15,8 +15,12 @@ parser.add_argument('output', help = "Output path for processed event log")
 parser.add_argument('-mst', '--min_speaking_time', help = "Minimum duration of an aggregated call event to be considered (in sec.); default = 60", default = 60) 
 parser.add_argument('-d', '--day_timeout', help = "Number of days until the cancellation is considered a timeout; default = 20", default = 20) 
 parser.add_argument('-c', '--cluster_components', help = "Number of maximal clusters allowed used for call durations; default = 3", default = 3, type = int) 
+parser.add_argument('-stream', '--streaming', help = "Streams the log trace by trace with bounded memory, the duration clustering uses a separate first pass; default = False", action = 'store_true') 
+parser.add_argument('-columnar', '--columnar', help = "Additionally stores the processed log in the binary columnar log cache, later tools then skip the XES import, not with -stream; default = False", action = 'store_true') 
 
 args = parser.parse_args()
+if args.streaming and args.columnar:
+    parser.error("-columnar can not be combined with -stream, the columnar cache needs the whole log in memory")
 
 # helpfer function to check if element is contained in trace
 def contains(trace, element):
@@ -27,137 +31,155 @@ def contains(trace, element):
 
 # investigate number of offers - has no event for "sent offer"
 # discretise single 0_CREATED and 0_SENT events
-# works in_place (modified the passed log)
+# works in_place (modified the passed trace)
+def count_offers_trace(trace):
+    offer_count = -1
+    for e in trace:
+        if "O_CREATED" in e["concept:name"]:
+            offer_count += 1
+            e["concept:name"] += str(offer_count)
+
+        elif "O_SENT" in e["concept:name"] and "BACK" not in e["concept:name"]:
+            e["concept:name"] += str(offer_count)
+    return trace
+
 def count_offers(log):
     for trace in log:
-        offer_count = -1
-        for e in trace:
-            if "O_CREATED" in e["concept:name"]:
-                offer_count += 1
-                e["concept:name"] += str(offer_count)
+        count_offers_trace(trace)
 
-            elif "O_SENT" in e["concept:name"] and "BACK" not in e["concept:name"]:
-                e["concept:name"] += str(offer_count)
+# Transform trace into list format, easier removal and insertion of single events.
+def trace_to_list(trace):
+    current_trace = []
+    for event in trace:
+        event['case:concept:name'] = trace.attributes['concept:name']
+        current_trace.append(event)
+    current_trace.insert(0, {"concept:name": "start", 'case:concept:name':trace.attributes['concept:name'], 'time:timestamp': trace[0]['time:timestamp']}) #insert start event
+    return current_trace
 
-# Transform log into list format, log is represented as list of lists, easier removal and insertion of single events.
+# Transform log into list format, log is represented as list of lists
 def log_to_list(log):
-    transformed_log = []
-    for trace in log:
-        current_trace = []
-        for event in trace:
-            event['case:concept:name'] = trace.attributes['concept:name']
-            current_trace.append(event)
-        current_trace.insert(0, {"concept:name": "start", 'case:concept:name':trace.attributes['concept:name'], 'time:timestamp': trace[0]['time:timestamp']}) #insert start event
-        transformed_log.append(current_trace)
-    return transformed_log
+    return [trace_to_list(trace) for trace in log]
 
+# Only cancelled and approved traces are kept, Final events are appended; returns None for incomplete traces
+def filter_incomplete_trace(trace):
+    outcomes = ["A_CANCELLED", "A_APPROVED"] # "A_DECLINED",
+    trace_copy = list(trace)
+    contained = False
+    for o in outcomes:
+        if contains(trace, o):
+            contained = True
+    if not contained:
+        return None
+    if contains(trace, "A_CANCELLED"):
+        trace_copy.append({'concept:name': "negative", 'time:timestamp': trace[-1]['time:timestamp'], 'case:concept:name': trace[0]['case:concept:name']})
+    if contains(trace, "A_APPROVED"):
+        trace_copy.append({'concept:name': "positive", 'time:timestamp': trace[-1]['time:timestamp'], 'case:concept:name': trace[0]['case:concept:name']})
+    assert(contains(trace_copy, "negative") or contains(trace_copy, "positive"))
+    return trace_copy
 
-# Only cancelled and approved events are kept in the log, Final events are appended.
 def filter_incomplete_traces(log):
-    transformed_log = []
-    outcomes = ["A_CANCELLED", "A_APPROVED"] # "A_DECLINED",
-    for trace in log:
-        trace_copy = copy.deepcopy(trace)
-        contained = False
-        for o in outcomes:
-            if contains(trace, o):
-                contained = True
-        if contained:
-            if contains(trace, "A_CANCELLED"):
-                trace_copy.append({'concept:name': "negative", 'time:timestamp': trace[-1]['time:timestamp'], 'case:concept:name': trace[0]['case:concept:name']})
-            if contains(trace, "A_APPROVED"):
-                trace_copy.append({'concept:name': "positive", 'time:timestamp': trace[-1]['time:timestamp'], 'case:concept:name': trace[0]['case:concept:name']})
-            assert(contains(trace_copy, "negative") or contains(trace_copy, "positive"))
-            transformed_log.append(trace_copy)
-    return transformed_log
+    return [trace for trace in map(filter_incomplete_trace, log) if trace is not None]
+
+def variant(trace):
+    return str([k["concept:name"] for k in trace])
 
 def variants(log):
-    element_list = []
-    for trace in log:
-        new_trace = [k["concept:name"] for k in trace]
-        element_list.append(new_trace)
-    print(len(Counter(str(e) for e in element_list).keys()))
+    print(len(Counter(variant(trace) for trace in log).keys()))
 
-# Filter events from log and compute durations of single calls
-def adjust_durations(log):
-    transformed_log = []
-    for trace in log:
-        new_trace  = []
-        for i in range(len(trace)):
-            if "W_Nabellen" in trace[i]['concept:name']: # omits SCHEDULE and COMPLETE call events
-                if trace[i]['lifecycle:transition']=="START":
-                    found = False
-                    duration = 0
-                    j = i
-                    while not found:
-                        j = j+1
-                        if j >= len(trace):
-                            for e in trace:
-                                print(e["concept:name"], e['lifecycle:transition'])
-                        assert(j < len(trace))
-                        if trace[j]['concept:name'] == trace[i]['concept:name']:
-                            assert(trace[j]['lifecycle:transition'] != "START")
-                            if  trace[j]['lifecycle:transition']=="COMPLETE":
-                                found = True
-                                duration = (trace[j]['time:timestamp']-trace[i]['time:timestamp']).total_seconds()
-                        
-                    if duration > args.min_speaking_time:
-                        if new_trace[-1]["concept:name"] == trace[i]['concept:name']: # merge call times together
-                            new_trace[-1]["duration"] += duration
-                        else:
-                            new_element = copy.deepcopy(trace[i])
-                            new_element["duration"] = duration
-                            new_trace.append(new_element)
-            if trace[i]['concept:name'] == "A_Cancelled": #differentiate between user_abort and timeout
-                new_element = copy.deepcopy(trace[i])
-                if (trace[i]['time:timestamp']-trace[i-1]['time:timestamp']).days >= args.day_timeout or (trace[i]['time:timestamp']-trace[i-2]['time:timestamp']).days >= args.day_timeout :
-                    new_element[-1]['concept:name'] = "TIMEOUT"
-                    assert(False) # no timeouts detected before cancellation
-                else:
-                    new_element[-1]['concept:name'] += " CUSTOMER"
-                new_trace.append(new_element)
+# Filter events from trace and compute durations of single calls
+def adjust_durations_trace(trace):
+    new_trace  = []
+    for i in range(len(trace)):
+        if "W_Nabellen" in trace[i]['concept:name']: # omits SCHEDULE and COMPLETE call events
+            if trace[i]['lifecycle:transition']=="START":
+                found = False
+                duration = 0
+                j = i
+                while not found:
+                    j = j+1
+                    if j >= len(trace):
+                        for e in trace:
+                            print(e["concept:name"], e['lifecycle:transition'])
+                    assert(j < len(trace))
+                    if trace[j]['concept:name'] == trace[i]['concept:name']:
+                        assert(trace[j]['lifecycle:transition'] != "START")
+                        if  trace[j]['lifecycle:transition']=="COMPLETE":
+                            found = True
+                            duration = (trace[j]['time:timestamp']-trace[i]['time:timestamp']).total_seconds()
+                    
+                if duration > args.min_speaking_time:
+                    if new_trace[-1]["concept:name"] == trace[i]['concept:name']: # merge call times together
+                        new_trace[-1]["duration"] += duration
+                    else:
+                        new_element = copy.copy(trace[i])
+                        new_element["duration"] = duration
+                        new_trace.append(new_element)
+        if trace[i]['concept:name'] == "A_Cancelled": #differentiate between user_abort and timeout
+            new_element = copy.copy(trace[i])
+            if (trace[i]['time:timestamp']-trace[i-1]['time:timestamp']).days >= args.day_timeout or (trace[i]['time:timestamp']-trace[i-2]['time:timestamp']).days >= args.day_timeout :
+                new_element[-1]['concept:name'] = "TIMEOUT"
+                assert(False) # no timeouts detected before cancellation
+            else:
+                new_element[-1]['concept:name'] += " CUSTOMER"
+            new_trace.append(new_element)
+        else:
+            if "W_" in trace[i]['concept:name']:  # skip other workflow elements
+                continue
+            if "O_SELECTED" in trace[i]['concept:name']:
+                continue
+            if "O_SENT" in trace[i]['concept:name'] and "BACK" not in trace[i]['concept:name']: # skip sent event, but not send_back
+                continue
+            elif "O_DECLINED" in trace[i]['concept:name'] or "A_PARTLYSUBMITTED" in trace[i]['concept:name']: # skip trivial elements
+                continue
             else:
-                if "W_" in trace[i]['concept:name']:  # skip other workflow elements
-                    continue
-                if "O_SELECTED" in trace[i]['concept:name']:
-                    continue
-                if "O_SENT" in trace[i]['concept:name'] and "BACK" not in trace[i]['concept:name']: # skip sent event, but not send_back
-                    continue
-                elif "O_DECLINED" in trace[i]['concept:name'] or "A_PARTLYSUBMITTED" in trace[i]['concept:name']: # skip trivial elements
-                    continue
-                else:
-                    new_trace.append(trace[i])
-
-        transformed_log.append(new_trace)
-    return transformed_log
-
-# Function to merge the 4 events present in successful logs: A_APPROVED, O_ACCEPTED, A_ACTIVATED and A_REGISTERED
+                new_trace.append(trace[i])
+
+    return new_trace
+
+def adjust_durations(log):
+    return [adjust_durations_trace(trace) for trace in log]
+
+# Function to merge the 4 events present in successful traces: A_APPROVED, O_ACCEPTED, A_ACTIVATED and A_REGISTERED
+def merge_successful_trace(trace):
+    if contains(trace, "A_APPROVED"):
+        modified_trace = list(trace)
+
+        for j in range(len(modified_trace)):
+            if modified_trace[j]["concept:name"] == "O_ACCEPTED":
+                modified_trace.pop(j)
+                break
+
+        for j in range(len(modified_trace)):
+            if modified_trace[j]["concept:name"] == "A_ACTIVATED":
+                modified_trace.pop(j)
+                break
+        
+        for j in range(len(modified_trace)):
+            if modified_trace[j]["concept:name"] == "A_REGISTERED":
+                modified_trace.pop(j)
+                break
+        
+        return modified_trace
+
+    return trace
+
 def merge_successful(log):
-    transformed_log = []
-    for trace in log:
-        if contains(trace, "A_APPROVED"):
-            modified_trace = copy.deepcopy(trace)
-
-            for j in range(len(modified_trace)):
-                if modified_trace[j]["concept:name"] == "O_ACCEPTED":
-                    modified_trace.pop(j)
-                    break
-
-            for j in range(len(modified_trace)):
-                if modified_trace[j]["concept:name"] == "A_ACTIVATED":
-                    modified_trace.pop(j)
-                    break
-            
-            for j in range(len(modified_trace)):
-                if modified_trace[j]["concept:name"] == "A_REGISTERED":
-                    modified_trace.pop(j)
-                    break
-            
-            transformed_log.append(modified_trace)
+    return [merge_successful_trace(trace) for trace in log]
 
-        else:
-            transformed_log.append(trace)
-    return transformed_log
+# Per-trace preprocessing up to the duration clustering, returns None for removed traces
+def preprocess_trace(trace):
+    trace = filter_incomplete_trace(trace_to_list(count_offers_trace(trace)))
+    if trace is None:
+        return None
+    return merge_successful_trace(adjust_durations_trace(trace))
+
+# Collects the durations of call events per call type
+def collect_response_times(trace, response_times):
+    for e in trace:
+        if "W_Nabellen" in e['concept:name']:
+            if e['concept:name'] not in response_times:
+                response_times[e['concept:name']] = []
+            response_times[e['concept:name']].append(e['duration'])
 
 # Cluster call events based on call durations by Bayesian-Gaussian mixture clustering
 def get_bayesian_gaussian_mixture(components, times):
@@ -174,62 +196,87 @@ def get_bayesian_gaussian_mixture(components, times):
         duration_classifier[t] = g
     return duration_classifier
 
+# works in_place (modifies the passed trace)
+def classify_trace(trace, predictor):
+    for pos in range(1,len(trace)):
+        action = trace[pos]["concept:name"]
+        if "W_Nabellen" not in action:
+            continue
+        assert("duration" in trace[pos])
+        duration = trace[pos]["duration"]
+        suffix = str(predictor[action].predict(np.array(duration).reshape(1,-1))[0])
+        assert(int(suffix) in list(range(0,100)))
+        trace[pos]["concept:name"] += "#"+suffix
+    return trace
+
 def classify_log(log, predictor):
-    log = copy.deepcopy(log)
     for trace in log:
-        for pos in range(1,len(trace)):
-            action = trace[pos]["concept:name"]
-            if "W_Nabellen" not in action:
-                continue
-            assert("duration" in trace[pos])
-            duration = trace[pos]["duration"]
-            suffix = str(predictor[action].predict(np.array(duration).reshape(1,-1))[0])
-            assert(int(suffix) in list(range(0,100)))
-            trace[pos]["concept:name"] += "#"+suffix
-
+        classify_trace(trace, predictor)
     return log
 
-# export the log for easier further analysis
-def export(log, path):
-    # to use the pm4py write_xes function, an pm4py event log object is needed.
-    # for this is the list event log via the pandas data frame to a pm4py event log converted.
-    log_df = pd.DataFrame()
+def checked(log):
     for trace in log:
         assert(trace[0]["concept:name"]=="start")
         assert(contains(trace, "negative") or contains(trace, "positive"))
-        log_df = log_df.append(trace, ignore_index=True)
-
-    event_log = pm4py.convert_to_event_log(log_df)
-    pm4py.write_xes(event_log, path) 
-
-#load event log
-log_application = xes_importer.apply(args.input)
-
-# enumerate offers
-count_offers(log_application)
-# transform to list
-list_log_application = log_to_list(log_application)
-#remove incomplete traces
-list_log_application = filter_incomplete_traces(list_log_application)
-print("Variants before removing trivial elements")
-variants(list_log_application)
-#remove trivial elements
-list_log_application = adjust_durations(list_log_application)
-list_log_application = merge_successful(list_log_application)
-print("Variants after removing trivial events")
-variants(list_log_application)
-
-# uses Bayesian-Gaussian Mixture clustering to discretise durations
-response_times = {}
-for trace in list_log_application:
-    for e in trace:
-        if "W_Nabellen" in e['concept:name']:
-            if e['concept:name'] not in response_times:
-                response_times[e['concept:name']] = []
-            response_times[e['concept:name']].append(e['duration'])
+        yield trace
+
+# export the log for easier further analysis, written trace by trace
+def export(log, path):
+    xes_writer.write_xes(checked(log), path, columnar = args.columnar)
+
+if not args.streaming:
+    #load event log
+    log_application = log_cache.load_log(args.input)
+
+    # enumerate offers
+    count_offers(log_application)
+    # transform to list
+    list_log_application = log_to_list(log_application)
+    #remove incomplete traces
+    list_log_application = filter_incomplete_traces(list_log_application)
+    print("Variants before removing trivial elements")
+    variants(list_log_application)
+    #remove trivial elements
+    list_log_application = adjust_durations(list_log_application)
+    list_log_application = merge_successful(list_log_application)
+    print("Variants after removing trivial events")
+    variants(list_log_application)
+
+    # uses Bayesian-Gaussian Mixture clustering to discretise durations
+    response_times = {}
+    for trace in list_log_application:
+        collect_response_times(trace, response_times)
+
+    predictor = get_bayesian_gaussian_mixture(args.cluster_components, response_times)
+    list_log_application = classify_log(list_log_application, predictor)
+
+    # write output
+    export(list_log_application, args.output+"bpi2012.xes")
+else:
+    # first pass: variant counts and call durations for the clustering
+    variants_before = set()
+    variants_after = set()
+    response_times = {}
+    for trace in xes_stream.read_traces(args.input):
+        trace = filter_incomplete_trace(trace_to_list(count_offers_trace(trace)))
+        if trace is None:
+            continue
+        variants_before.add(variant(trace))
+        trace = merge_successful_trace(adjust_durations_trace(trace))
+        variants_after.add(variant(trace))
+        collect_response_times(trace, response_times)
+    print("Variants before removing trivial elements")
+    print(len(variants_before))
+    print("Variants after removing trivial events")
+    print(len(variants_after))
+
+    # uses Bayesian-Gaussian Mixture clustering to discretise durations
+    predictor = get_bayesian_gaussian_mixture(args.cluster_components, response_times)
 
-predictor = get_bayesian_gaussian_mixture(args.cluster_components, response_times)
-list_log_application = classify_log(list_log_application, predictor)
+    # second pass: per-trace pipeline and classification
+    log = xes_stream.read_traces(args.input)
+    log = (trace for trace in map(preprocess_trace, log) if trace is not None)
+    log = (classify_trace(trace, predictor) for trace in log)
 
-# write output
-export(list_log_application, args.output+"bpi2012.xes")
\ No newline at end of file
+    # write output
+    export(log, args.output+"bpi2012.xes")
\ No newline at end of file
@@ -1,7 +1,11 @@
 import argparse
-import pandas as pd
 import pm4py
-from pm4py.objects.log.importer.xes import importer as xes_importer
+from collections import Counter
+from pm4py.algo.filtering.log.timestamp import timestamp_filter
+from pm4py.algo.filtering.common.timestamp.timestamp_common import get_dt_from_string
+import log_cache
+import xes_stream
+import xes_writer
 
 parser = argparse.ArgumentParser(
                     prog = 'log_parser',
@@ -10,8 +14,12 @@ parser.add_argument('input', help = "Input file for BIPC'17 event log")
 parser.add_argument('output', help = "Output path for processed event logs") 
 parser.add_argument('-mst', '--min_speaking_time', help = "Minimum duration of an aggregated call event to be considered (in sec.); default = 60", default = 60) 
 parser.add_argument('-d', '--day_timeout', help = "Number of days until the cancellation is considered a timeout; default = 20", default = 20) 
+parser.add_argument('-stream', '--streaming', help = "Streams the log trace by trace with bounded memory, the variant filter uses a separate counting pass; default = False", action = 'store_true') 
+parser.add_argument('-columnar', '--columnar', help = "Additionally stores the processed log in the binary columnar log cache, later tools then skip the XES import, not with -stream; default = False", action = 'store_true') 
 
 args = parser.parse_args()
+if args.streaming and args.columnar:
+    parser.error("-columnar can not be combined with -stream, the columnar cache needs the whole log in memory")
 
 # Filter function to remove outliers; all singleton traces
 def filter_log(log):
@@ -24,122 +32,154 @@ def contains(trace, element):
         if event['concept:name']==element:
             return True
 
-def construct_log(log):
+# Constructs the processed trace, returns None if the trace does not reach a terminal state
+def construct_trace(trace):
     terminal_states = ['A_Cancelled COMPANY', 'A_Cancelled CUSTOMER', 'A_Pending', 'TIMEOUT']
     to_merge = ['W_Call incomplete files', 'W_Call after offers', 'W_Complete application', 'W_Validate application']
-    log_activities = []
-    for trace in log:
-        current_trace = [trace[0]]
-        current_trace[0]['case:concept:name'] = trace.attributes['concept:name']
-        for i in range(1,len(trace)):
-            pos = trace[i]
-            pos['case:concept:name'] = trace.attributes['concept:name']
-            if "W_Call" in trace[i]['concept:name']:
-                # search for closing event
-                if pos['lifecycle:transition'] in ["start", "resume"]:
-                    for inner_index in range(i+1, len(trace)):
-                        inner_pos = trace[inner_index]
-                        if pos['concept:name'] == inner_pos['concept:name']:
-                            if inner_pos['lifecycle:transition'] in ["suspend", "complete"]:                 
-                                duration = (inner_pos['time:timestamp']-pos['time:timestamp']).total_seconds()
-                                if duration > args.min_speaking_time:
-                                    if pos['concept:name'] in current_trace[-1]["concept:name"]:
-                                        current_trace[-1]["duration"] += duration
-                                    else:
-                                        current_trace.append(pos)
-                                        current_trace[-1]['duration'] = duration
-                                    if current_trace[-1]["duration"] < 600:
-                                        current_trace[-1]['concept:name'] = pos['concept:name']+" SHORT"
-                                    elif current_trace[-1]["duration"] < 14400:
-                                        current_trace[-1]['concept:name'] = pos['concept:name']+" LONG"
-                                    else:
-                                        current_trace[-1]['concept:name'] = pos['concept:name']+" SUPER LONG"
-                            break
-            if "W_" in trace[i]['concept:name']:
-                continue # skip other workflow events
-            if trace[i]['concept:name'] in ["A_Created", "A_Complete", "A_Incomplete"]:
-                continue # skip trivial elements
-            if trace[i]['concept:name'] == "A_Cancelled": #differentiate between user_abort and timeout
-                current_trace.append(pos)
-                if (trace[i]['time:timestamp']-trace[i-1]['time:timestamp']).days >= args.day_timeout:
-                    current_trace[-1]['concept:name'] = "TIMEOUT"
-                else:
-                    current_trace[-1]['concept:name'] += " CUSTOMER"
+    current_trace = [trace[0]]
+    current_trace[0]['case:concept:name'] = trace.attributes['concept:name']
+    for i in range(1,len(trace)):
+        pos = trace[i]
+        pos['case:concept:name'] = trace.attributes['concept:name']
+        if "W_Call" in trace[i]['concept:name']:
+            # search for closing event
+            if pos['lifecycle:transition'] in ["start", "resume"]:
+                for inner_index in range(i+1, len(trace)):
+                    inner_pos = trace[inner_index]
+                    if pos['concept:name'] == inner_pos['concept:name']:
+                        if inner_pos['lifecycle:transition'] in ["suspend", "complete"]:                 
+                            duration = (inner_pos['time:timestamp']-pos['time:timestamp']).total_seconds()
+                            if duration > args.min_speaking_time:
+                                if pos['concept:name'] in current_trace[-1]["concept:name"]:
+                                    current_trace[-1]["duration"] += duration
+                                else:
+                                    current_trace.append(pos)
+                                    current_trace[-1]['duration'] = duration
+                                if current_trace[-1]["duration"] < 600:
+                                    current_trace[-1]['concept:name'] = pos['concept:name']+" SHORT"
+                                elif current_trace[-1]["duration"] < 14400:
+                                    current_trace[-1]['concept:name'] = pos['concept:name']+" LONG"
+                                else:
+                                    current_trace[-1]['concept:name'] = pos['concept:name']+" SUPER LONG"
+                        break
+        if "W_" in trace[i]['concept:name']:
+            continue # skip other workflow events
+        if trace[i]['concept:name'] in ["A_Created", "A_Complete", "A_Incomplete"]:
+            continue # skip trivial elements
+        if trace[i]['concept:name'] == "A_Cancelled": #differentiate between user_abort and timeout
+            current_trace.append(pos)
+            if (trace[i]['time:timestamp']-trace[i-1]['time:timestamp']).days >= args.day_timeout:
+                current_trace[-1]['concept:name'] = "TIMEOUT"
+            else:
+                current_trace[-1]['concept:name'] += " CUSTOMER"
+            continue
+        if "O_Created" == trace[i]['concept:name']:
+            continue # merge create and created
+        if trace[i]['concept:name'] in terminal_states:
+            current_trace.append(pos)
+        else:
+            if trace[i]['concept:name'] in to_merge and trace[i]['concept:name'] == trace[i-1]['concept:name']:
                 continue
-            if "O_Created" == trace[i]['concept:name']:
-                continue # merge create and created
-            if trace[i]['concept:name'] in terminal_states:
-                current_trace.append(pos)
             else:
-                if trace[i]['concept:name'] in to_merge and trace[i]['concept:name'] == trace[i-1]['concept:name']:
-                    continue
-                else:
-                    current_trace.append(pos)
-        if "A_Pending" in [pos['concept:name'] for pos in current_trace]:
-            if "O_Cancelled" in [pos['concept:name'] for pos in current_trace]:
-                for pos1 in current_trace:
-                    if 'O_Cancelled' in pos1['concept:name']:
-                        current_trace.remove(pos1)
-        intersection = [i for i in trace if i['concept:name'] in terminal_states]
-        for state in terminal_states:
-            indices = [i for i, x in enumerate(current_trace) if x['concept:name'] == state]
-            if indices:
-                current_trace = current_trace[:indices[0]+1]
-        if intersection:
+                current_trace.append(pos)
+    if "A_Pending" in [pos['concept:name'] for pos in current_trace]:
+        if "O_Cancelled" in [pos['concept:name'] for pos in current_trace]:
+            for pos1 in current_trace:
+                if 'O_Cancelled' in pos1['concept:name']:
+                    current_trace.remove(pos1)
+    intersection = [i for i in trace if i['concept:name'] in terminal_states]
+    for state in terminal_states:
+        indices = [i for i, x in enumerate(current_trace) if x['concept:name'] == state]
+        if indices:
+            current_trace = current_trace[:indices[0]+1]
+    if intersection:
+        return current_trace
+    return None
+
+def construct_log(log):
+    log_activities = []
+    for trace in log:
+        current_trace = construct_trace(trace)
+        if current_trace is not None:
             log_activities.append(current_trace)
     
     return log_activities
 
-# process log to iterate created offers and differentiate between positive and negative traces
-def process_log(log):
+# process trace to iterate created offers and differentiate between positive and negative traces
+def process_trace(trace):
     MAX_INDEX = 100
-    for trace in log:
-        isPositive = False
-        if contains(trace, 'A_Pending'):
-            isPositive = True
-        trace.insert(0,{'concept:name': 'start', 'case:concept:name': trace[0]['case:concept:name'], 'time:timestamp': trace[0]['time:timestamp']})
-        if isPositive:
-            trace.append({'concept:name': 'positive', 'case:concept:name': trace[0]['case:concept:name'], 'time:timestamp': trace[0]['time:timestamp']})
-        else:
-            trace.append({'concept:name': 'negative', 'case:concept:name': trace[0]['case:concept:name'], 'time:timestamp': trace[0]['time:timestamp']})
+    isPositive = False
+    if contains(trace, 'A_Pending'):
+        isPositive = True
+    trace.insert(0,{'concept:name': 'start', 'case:concept:name': trace[0]['case:concept:name'], 'time:timestamp': trace[0]['time:timestamp']})
+    if isPositive:
+        trace.append({'concept:name': 'positive', 'case:concept:name': trace[0]['case:concept:name'], 'time:timestamp': trace[0]['time:timestamp']})
+    else:
+        trace.append({'concept:name': 'negative', 'case:concept:name': trace[0]['case:concept:name'], 'time:timestamp': trace[0]['time:timestamp']})
     
     to_extend = ["O_Create Offer"]
     for name in to_extend:
-        for trace in log:
-            indices = [i for i, x in enumerate(trace) if x['concept:name'] == name]
-            for i in indices:
-                count_indices = [j for j in indices if j < i]
-                index = MAX_INDEX if len(count_indices) > MAX_INDEX else len(count_indices)
-                trace[i]['concept:name'] += " "+str(index)
+        indices = [i for i, x in enumerate(trace) if x['concept:name'] == name]
+        for i in indices:
+            count_indices = [j for j in indices if j < i]
+            index = MAX_INDEX if len(count_indices) > MAX_INDEX else len(count_indices)
+            trace[i]['concept:name'] += " "+str(index)
+    return trace
 
+def process_log(log):
+    for trace in log:
+        process_trace(trace)
 
+# export the log trace by trace
 def export(log, path):
-    log_df = pd.DataFrame()
-    for trace in log:
-        log_df = log_df.append(trace, ignore_index=True)
+    xes_writer.write_xes(log, path+".xes", columnar = args.columnar)
+
+def variant(trace):
+    return tuple(event['concept:name'] for event in trace)
+
+# time ranges before and after the concept drift
+ranges = {"before": ("2011-03-09 00:00:00", "2016-06-30 23:59:59"), "after": ("2016-08-01 00:00:00", "2018-03-09 00:00:00")}
+
+if not args.streaming:
+    # Load the log
+    log = log_cache.load_log(args.input)
 
-    event_log = pm4py.convert_to_event_log(log_df)
-    pm4py.write_xes(event_log, path+".xes")
+    # split at concept drift
+    log_before = pm4py.filter_time_range(log, ranges["before"][0], ranges["before"][1], mode='traces_contained')
+    log_after = pm4py.filter_time_range(log, ranges["after"][0], ranges["after"][1], mode='traces_contained')
 
-# Load the log
-log = xes_importer.apply(args.input)
+    # filter outliers
+    filtered_log_before = filter_log(log_before)
+    filtered_log_after = filter_log(log_after)
 
-# split at concept drift
-log_before = pm4py.filter_time_range(log, "2011-03-09 00:00:00", "2016-06-30 23:59:59", mode='traces_contained')
-log_after = pm4py.filter_time_range(log, "2016-08-01 00:00:00", "2018-03-09 00:00:00", mode='traces_contained')
+    # construct log
+    filtered_log_before = construct_log(filtered_log_before)
+    filtered_log_after = construct_log(filtered_log_after)
 
-# filter outliers
-filtered_log_before = filter_log(log_before)
-filtered_log_after = filter_log(log_after)
+    # append positive or negative outcome
+    process_log(filtered_log_before)
+    process_log(filtered_log_after)
 
-# construct log
-filtered_log_before = construct_log(filtered_log_before)
-filtered_log_after = construct_log(filtered_log_after)
+    #export
+    export(filtered_log_before, args.output+"bpic2017_before")
+    export(filtered_log_after, args.output+"bpic2017_after")
+else:
+    dates = {r : (get_dt_from_string(ranges[r][0]), get_dt_from_string(ranges[r][1])) for r in ranges}
 
-# append positive or negative outcome
-process_log(filtered_log_before)
-process_log(filtered_log_after)
+    # first pass: variant counts for the outlier filter, per time range
+    variant_counts = {r : Counter() for r in ranges}
+    for trace in xes_stream.read_traces(args.input):
+        for r in ranges:
+            if timestamp_filter.is_contained(trace, dates[r][0], dates[r][1], "time:timestamp"):
+                variant_counts[r][variant(trace)] += 1
 
-#export
-export(filtered_log_before, args.output+"bpic2017_before")
-export(filtered_log_after, args.output+"bpic2017_after")
\ No newline at end of file
+    # second pass: per-trace pipeline of split, filter, construction and outcome
+    for r in ranges:
+        number_traces = sum(variant_counts[r].values())
+        perc = 2/number_traces # same threshold as filter_log
+        log = xes_stream.read_traces(args.input)
+        log = (trace for trace in log if timestamp_filter.is_contained(trace, dates[r][0], dates[r][1], "time:timestamp"))
+        log = (trace for trace in log if variant_counts[r][variant(trace)] >= perc * number_traces)
+        log = (trace for trace in map(construct_trace, log) if trace is not None)
+        log = map(process_trace, log)
+        export(log, args.output+"bpic2017_"+r)
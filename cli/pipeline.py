@@ -0,0 +1,237 @@
+import os
+import csv
+import json
+import time
+import signal
+import multiprocessing
+import multiprocessing.connection
+from collections import deque
+import artifact_store
+import process_model
+import build_game
+import decision_boundary
+import verdict_cache
+import decision_boundary_reduction
+import graph_format
+
+# In-process pipeline of the command line tools: process models -> games -> decision boundaries -> reduced games.
+# Every stage is a function on in-memory graphs, the input graph of a stage is not modified.
+# Artifacts are only written if an output path is given, under the names the command line tools use, in file_format (see graph_format.py).
+# With store, the artifacts are looked up in and added to the artifact store (see artifact_store.py): a stage is only
+# computed if no artifact of the same input, stage and parameters is stored.
+
+QUERY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'guaranteed_tool.q')
+
+# Stage 1: process models of all types and histories, built in one pass over the log (see process_model.stored_process_models)
+
+# Stage 2: game of the process model, actors maps actions to their actor (see build_game.py)
+def game(model, actors):
+    return build_game.build_game(model.copy(), actors)
+
+# Stage 3: game annotated with the results and the decision boundary for the unrolling factor,
+# the options are the ones of decision_boundary.py, previous are the results of another unrolling factor to warm start from
+def boundary(g, unrolling_factor, previous = None, **options):
+    options.setdefault("query", QUERY)
+    decision_boundary.configure(unrolling_factor = unrolling_factor, **options)
+    return decision_boundary.decision_boundary(g.copy(), previous)
+
+# Stage 4: reduced game, the decided states are merged into one positive and one negative state
+def reduced(g, static = False):
+    g = decision_boundary_reduction.db_reduction(g.copy(), static)
+    g.graph["reduced_graph"] = True
+    return g
+
+# A decision boundary is final if no query exceeded the timeout, see decision_boundary.query
+def final_boundary(g):
+    return not decision_boundary.timed_out
+
+def boundary_parameters(unrolling_factor, options):
+    return decision_boundary.store_parameters(dict({"query" : QUERY}, **options, unrolling_factor = unrolling_factor))
+
+def write(g, name, output):
+    if output is not None:
+        graph_format.write_graph(g, name)
+        print("Generated:", name)
+
+# Decision boundary of a (reduced) game
+def boundary_states(g):
+    return [n for n in g if 'decision_boundary' in g.nodes[n] and g.nodes[n]['decision_boundary']]
+
+# Chains the stages for all histories and unrolling factors of the given type
+# The unrolling of a history is aborted after the first unrolling factor whose decision boundary took longer than timeout seconds
+# With warm_start, the decision boundary of an unrolling factor reuses the results of the previous one (see decision_boundary.query)
+# unless a query of the previous one timed out
+# Returns the decision boundary per name of the reduced game, the artifacts are written if output is given
+def run(log_path, activities_path, output = None, abstraction_type = "sequence", histories = range(1, 4), unrolling_factors = range(1, 2), timeout = None, store = True, file_format = graph_format.DEFAULT_FORMAT, warm_start = False, **options):
+    with open(activities_path) as f:
+        actors = json.loads(f.read())
+    prefix = "" if output is None else output
+    options.setdefault("output", prefix)
+
+    decision_boundaries = {}
+    models, model_keys = process_model.stored_process_models(log_path, [abstraction_type], histories, store = store)
+    for (model_type, history), model in models.items():
+        model_name = process_model.output_name(prefix, log_path, model_type, history, file_format)
+        write(model, model_name, output)
+
+        g, game_key = artifact_store.cached("game", model_keys[(model_type, history)], {"actors" : actors}, lambda: game(model, actors))
+        game_name = build_game.output_name(prefix, model_name, activities_path, file_format)
+        write(g, game_name, output)
+
+        previous = None
+        for k in unrolling_factors:
+            started = time.time()
+            b, boundary_key = artifact_store.cached("decision_boundary", game_key, boundary_parameters(k, options), lambda: boundary(g, k, previous, **options), final_boundary)
+            boundary_name = decision_boundary.output_name(prefix, game_name, k, file_format)
+            write(b, boundary_name, output)
+            if warm_start:
+                previous = decision_boundary.previous_results(b)
+
+            r, reduced_key = artifact_store.cached("reduction", boundary_key, {"static" : False}, lambda: reduced(b))
+            reduced_name = decision_boundary_reduction.output_name(prefix, boundary_name, file_format)
+            write(r, reduced_name, output)
+            decision_boundaries[reduced_name] = boundary_states(r)
+
+            if timeout is not None and time.time() - started > timeout:
+                print("Timeout - abort further unrolling")
+                break
+    return decision_boundaries
+
+# Job of the sweep, run in its own process: decision boundary and reduction of the game for one unrolling factor
+# Sends the name of the reduced game, its decision boundary, the timings of both stages and the results of the states
+# (to warm start larger unrolling factors, None if a query timed out) through the connection
+def sweep_point(connection, g, game_name, game_key, unrolling_factor, previous, output, file_format, options):
+    os.setpgrp() # own process group, such that stop() also kills the verifyta calls
+    prefix = "" if output is None else output
+    timings = {}
+    started = time.time()
+    b, boundary_key = artifact_store.cached("decision_boundary", game_key, boundary_parameters(unrolling_factor, options), lambda: boundary(g, unrolling_factor, previous, **options), final_boundary)
+    timings["boundary"] = time.time() - started
+    boundary_name = decision_boundary.output_name(prefix, game_name, unrolling_factor, file_format)
+    write(b, boundary_name, output)
+
+    started = time.time()
+    r, reduced_key = artifact_store.cached("reduction", boundary_key, {"static" : False}, lambda: reduced(b))
+    timings["reduction"] = time.time() - started
+    reduced_name = decision_boundary_reduction.output_name(prefix, boundary_name, file_format)
+    write(r, reduced_name, output)
+    connection.send((reduced_name, boundary_states(r), timings, decision_boundary.previous_results(b)))
+    connection.close()
+
+# Kills a grid point with its verifyta calls and removes the temporary files they leave behind
+def stop(process, options):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        process.kill() # not yet in its own process group
+    process.join()
+    decision_boundary.remove_temporary(options["output"], process.pid)
+    artifact_store.remove_temporary(process.pid)
+    verdict_cache.remove_temporary(process.pid)
+
+TABLE_COLUMNS = ["history", "unrolling_factor", "status", "name", "decision_boundary_size", "decision_boundary", "process_models", "game", "boundary", "reduction", "warm_start"]
+
+# Writes the results of the sweep as CSV table, one row per grid point, timings in seconds
+# status: done, timeout, cancelled (a smaller unrolling factor of the history timed out) or failed
+# warm_start: the unrolling factor whose results were reused, empty for a computation from scratch
+def write_table(rows, path):
+    with open(path, "w", newline = "") as f:
+        writer = csv.DictWriter(f, fieldnames = TABLE_COLUMNS)
+        writer.writeheader()
+        for row in sorted(rows, key = lambda row: (row["history"], row["unrolling_factor"])):
+            writer.writerow(dict(row, decision_boundary = json.dumps(row["decision_boundary"])))
+    print("Generated:", path)
+
+# Parameter sweep over the grid histories x unrolling factors of the given type with up to processes concurrent grid points
+# The process models (one pass over the log) and the games are built once and shared by all unrolling factors of a history.
+# Every grid point runs in its own process, smaller unrolling factors are started first; a grid point exceeding timeout
+# seconds is killed together with its verifyta calls (see stop) and the larger unrolling factors of its history are cancelled.
+# With store, stored artifacts are reused: changing only the unrolling factors rebuilds neither process models nor games.
+# With warm_start, a grid point reuses the results of the largest smaller unrolling factor of its history finished before it starts
+# without timed out queries.
+# Returns the rows of the results table (see write_table), the artifacts are written if output is given
+def sweep(log_path, activities_path, output = None, abstraction_type = "sequence", histories = range(1, 4), unrolling_factors = range(1, 2), timeout = None, processes = 1, store = True, file_format = graph_format.DEFAULT_FORMAT, warm_start = False, **options):
+    with open(activities_path) as f:
+        actors = json.loads(f.read())
+    prefix = "" if output is None else output
+    options.setdefault("output", prefix)
+
+    started = time.time()
+    models, model_keys = process_model.stored_process_models(log_path, [abstraction_type], histories, store = store)
+    model_time = time.time() - started
+
+    games = {}
+    game_times = {}
+    for (model_type, history), model in models.items():
+        model_name = process_model.output_name(prefix, log_path, model_type, history, file_format)
+        write(model, model_name, output)
+        started = time.time()
+        g, game_key = artifact_store.cached("game", model_keys[(model_type, history)], {"actors" : actors}, lambda: game(model, actors))
+        game_times[history] = time.time() - started
+        games[history] = (g, build_game.output_name(prefix, model_name, activities_path, file_format), game_key)
+        write(g, games[history][1], output)
+
+    def row(history, k, status, name = "", db = (), timings = None):
+        timings = timings or {}
+        return {"history" : history, "unrolling_factor" : k, "status" : status, "name" : name,
+            "decision_boundary_size" : len(db), "decision_boundary" : list(db), "process_models" : model_time,
+            "game" : game_times[history], "boundary" : timings.get("boundary"), "reduction" : timings.get("reduction"), "warm_start" : warm_started.get((history, k))}
+
+    pending = deque((history, k) for k in unrolling_factors for history in histories)
+    running = {} # grid point -> (process, connection, start time)
+    timed_out = {} # history -> smallest unrolling factor that timed out
+    results = {} # grid point -> results of the states, if finished without timed out queries and warm_start
+    warm_started = {} # grid point -> unrolling factor whose results it reuses
+    rows = []
+    try:
+        while pending or running:
+            while pending and len(running) < processes:
+                history, k = pending.popleft()
+                if history in timed_out and k > timed_out[history]:
+                    rows.append(row(history, k, "cancelled"))
+                    continue
+                finished = [j for h, j in results if h == history and j < k]
+                if finished:
+                    warm_started[(history, k)] = max(finished)
+                receiver, sender = multiprocessing.Pipe(duplex = False)
+                process = multiprocessing.Process(target = sweep_point, args = (sender, *games[history], k, results.get((history, warm_started.get((history, k)))), output, file_format, options))
+                process.start()
+                sender.close()
+                running[(history, k)] = (process, receiver, time.time())
+            if not running:
+                continue
+
+            wait = None
+            if timeout is not None:
+                wait = max(0, min(start + timeout for process, receiver, start in running.values()) - time.time())
+            ready = multiprocessing.connection.wait([receiver for process, receiver, start in running.values()], timeout = wait)
+
+            for (history, k), (process, receiver, start) in list(running.items()):
+                if receiver in ready:
+                    try:
+                        name, db, timings, point_results = receiver.recv()
+                        rows.append(row(history, k, "done", name, db, timings))
+                        if warm_start and point_results is not None:
+                            results[(history, k)] = point_results
+                    except EOFError:
+                        rows.append(row(history, k, "failed"))
+                    process.join()
+                    del running[(history, k)]
+                elif timeout is not None and time.time() - start > timeout:
+                    print("Timeout - history", history, "unrolling factor", k, "- abort further unrolling")
+                    stop(process, options)
+                    del running[(history, k)]
+                    rows.append(row(history, k, "timeout"))
+                    timed_out[history] = min(k, timed_out.get(history, k))
+
+            # larger unrolling factors of timed out histories that are already running are cancelled too
+            for (history, k), (process, receiver, start) in list(running.items()):
+                if history in timed_out and k > timed_out[history]:
+                    stop(process, options)
+                    del running[(history, k)]
+                    rows.append(row(history, k, "cancelled"))
+    finally:
+        # e.g. on KeyboardInterrupt, the grid points are not in the process group of the terminal
+        for process, receiver, start in running.values():
+            stop(process, options)
+    return rows
@@ -1,8 +1,12 @@
 import argparse
-from pm4py.objects.log.importer.xes import importer as xes_importer
+import log_cache
 import networkx as nx
-import json 
 import numpy as np 
+import abstraction
+import variant_log
+import transition_statistics
+import graph_format
+import artifact_store
 #from datetime import datetime
 
 parser = argparse.ArgumentParser(
@@ -10,69 +14,36 @@ parser = argparse.ArgumentParser(
                     description = "Takes an processed event log as input and computes a directly-follows process model with weights.",)
 parser.add_argument('input', help = "Input event log") 
 parser.add_argument('output', help = "Output path for process model") 
-parser.add_argument('-t', '--type', help = "Type of directly follows model: default = hist", default = "sequence", choices = ["sequence", "multiset"]) 
+parser.add_argument('-t', '--type', help = "Type of directly follows model, 'both' builds sequence and multiset models in the same pass: default = hist", default = "sequence", choices = ["sequence", "multiset", "both"]) 
 parser.add_argument('-hist', '--history', help = "Number of past steps to be included; default = 3", default = 3, type = int) 
-
-args = parser.parse_args()
-
-# Concats the trace to a multiset-history
-def ms(trace):
-    multiset = {}
-    for pos in trace:
-        if pos['concept:name'] not in multiset:
-            multiset[pos['concept:name']] = 1
-        else:
-            multiset[pos['concept:name']] += 1
-    return json.dumps(multiset, sort_keys=True).encode().decode("utf-8") # use json encodings for multisets
-
-# Computes the sequence-history of the given trace
-def sequence(trace): 
-    hist = str(trace[0]['concept:name'])
-    for pos in trace[1:]:
-        hist += " - " + str(pos['concept:name']) # construct history
-    return hist
-
-# Function to compute a transition system, given a pre-processed log
-def transition_system(log, history, abstraction):
-    edges = []
-    edge_counter = {}
-    controll = {}
-    action = {}
-    edge_mapping = {}
-    for trace_index in range(len(log)):
-        trace = log[trace_index]
-        s = "start"
-        assert(trace[0]['concept:name']=="start")
-        for pos_index in range(1,len(trace)):
-            pos = trace[pos_index]
-            activity = pos['concept:name']
-            #t = ms(trace[max(0,pos_index-history+1):pos_index+1])
-            t = abstraction(trace[max(0,pos_index-history+1):pos_index+1])
-            e = (s,t)
-            action[e] = activity
-            if e not in edges:
-                edges.append(e)
-                edge_counter[e] = 1
-                edge_mapping[e] = [trace_index]
-            else:
-                edge_counter[e] = edge_counter[e]+1
-                edge_mapping[e].append(trace_index)
-            s = t
+parser.add_argument('-max_hist', '--max_history', help = "Sweep mode: builds one model for every history from '--history' to '--max_history' in one pass over the log", default = None, type = int) 
+parser.add_argument('-stats', '--save_statistics', help = "Persists the edge statistics of every model next to it (.stats.json), needed for '--update'; default = False", action = 'store_true') 
+parser.add_argument('-p', '--processes', help = "Number of worker processes, the log is split into shards of variants whose partial statistics are merged; default = 1 (sequential)", default = 1, type = int) 
+parser.add_argument('-u', '--update', help = "Update mode: folds the input log as delta into the given process model, using its persisted edge statistics; type and history are taken from the model, the updated model keeps its file format", default = None) 
+parser.add_argument('-ns', '--no_store', help = "Neither reuses nor stores the process models in the artifact store (see artifact_store.py), the store is not used with '--save_statistics' and '--update'; default = False", action = 'store_true') 
+parser.add_argument('-f', '--format', help = "File format of the written process models: 'gexf' (e.g. for Gephi and the notebooks) or 'binary' (compact, read via memory map, see graph_format.py); default = gexf", default = "gexf", choices = ["binary", "gexf"]) 
+
+# Replaces the state ids of the edge statistics by the readable state labels
+def label_statistics(statistics, labels):
+    return {(labels[e[0]], labels[e[1]]) : statistics[e] for e in statistics}
+
+# Function to compute a transition system from the collected edge statistics
+def transition_system(statistics):
     g = nx.DiGraph()
-    for e in edges:
+    for e in statistics:
         g.add_edge(e[0], e[1])
     to_remove = [] # to remove selve-loops
     for e in g.edges:
         if e[0] == e[1]:
             to_remove.append(e)
         # set properties
-        g[e[0]][e[1]]['action'] = action[e]
+        g[e[0]][e[1]]['action'] = statistics[e]['action']
 
     for e in to_remove:
         if e in g.edges():
             g.remove_edge(e[0],e[1])
     
-    return g, edge_mapping
+    return g
 
 # compute weights
 def isInTrace(s,t, trace):
@@ -81,23 +52,16 @@ def isInTrace(s,t, trace):
             return True
     return False
 
-def weight(trace):
-    return 1 if any("positive" in pos['concept:name'] for pos in trace) else -1
-
 def entropy(p1, p2):
     if p1 == 0 or p2 == 0:
         return 0
     return - p1*np.log2(p1) - p2* np.log2(p2)
 
-def distribution(s,t,log, edge_mapping):
-    distr = {1.0: 0 , -1.0 : 0}
-    assert((s,t) in edge_mapping)
-    for trace_index in edge_mapping[(s,t)]:
-        w = weight(log[trace_index])
-        distr[w] += 1 #
-    return distr[1], distr[-1]
+def distribution(s,t, statistics):
+    assert((s,t) in statistics)
+    return statistics[(s,t)]['positive'], statistics[(s,t)]['negative']
 
-def compute_edge_cost(g, traces, edge_mapping):
+def compute_edge_cost(g, statistics):
     edge_cost = {}
     counter = 1
     for s in g.nodes:
@@ -105,7 +69,7 @@ def compute_edge_cost(g, traces, edge_mapping):
         for t in g[s]:
 
             
-            p1, p2 = distribution(s,t,traces, edge_mapping)
+            p1, p2 = distribution(s,t, statistics)
             w = 1 if p1 >= p2 else -1
 
             wp1 = p1/(p1+p2)
@@ -123,9 +87,9 @@ def annotate_graph(g, edge_cost):
         g[e[0]][e[1]]['cost'] = round(edge_cost[e],2)
     return g
 
-def add_traversal_information(g, edge_mapping):
+def add_traversal_information(g, statistics):
     for e in g.edges:
-        g.edges[e]['edge_traversal'] = len(edge_mapping[e])
+        g.edges[e]['edge_traversal'] = statistics[e]['traversal']
 
     for s in g:
         if s not in ["start"] and "pos" not in s and "neg" not in s:
@@ -137,17 +101,97 @@ def add_traversal_information(g, edge_mapping):
 
     return g
 
-log = xes_importer.apply(args.input)
+# Process model of the given edge statistics
+def build_model(statistics, labels):
+    model_statistics = label_statistics(statistics, labels)
+    system = transition_system(model_statistics)
+    edge_cost = compute_edge_cost(system, model_statistics)
 
-system, edge_mapping = transition_system(log, args.history, ms if args.type == "multiset" else sequence)
-edge_cost = compute_edge_cost(system, log, edge_mapping)
+    g = annotate_graph(system, edge_cost)
 
-g = annotate_graph(system, edge_cost)
-
-g = add_traversal_information(g, edge_mapping)
+    g = add_traversal_information(g, model_statistics)
+    return g
 
-name = args.output + "PMODEL" + "_" + "input:"+ args.input.split("/")[-1].split(".")[0]  + "_" + "type:" + args.type + "_"+ "history:"+ str(args.history) + '.gexf'
-# "_" + datetime.today().strftime('%Y-%m-%d#%H:%M:%S')
-# not sure if datetime needed
-nx.write_gexf(g, name) 
-print("Generated:", name)
\ No newline at end of file
+# Writes the process model of the given edge statistics
+def write_model(statistics, labels, name):
+    g = build_model(statistics, labels)
+
+    # "_" + datetime.today().strftime('%Y-%m-%d#%H:%M:%S')
+    # not sure if datetime needed
+    graph_format.write_graph(g, name)
+    print("Generated:", name)
+
+# Edge statistics of all models (type, history) in one pass over the variants, see transition_statistics.py
+def edge_statistics(variants, types, histories, processes = 1):
+    if processes > 1:
+        return transition_statistics.parallel_edge_statistics(variants, histories, types, processes)
+    return transition_statistics.edge_statistics(variants, histories, types)
+
+# Process models of all types and histories, built in one pass over the variants
+# Returns the models per (type, history)
+def process_models(variants, types, histories, processes = 1):
+    statistics, states, activities = edge_statistics(variants, types, histories, processes)
+    labels = {abstraction_type : abstraction.state_labels(states[abstraction_type], activities, abstraction_type) for abstraction_type in types}
+    return {model : build_model(statistics[model], labels[model[0]]) for model in statistics}
+
+# Process models of all types and histories of the log, only the ones not in the artifact store are built (in one pass over the log)
+# Returns the models and their keys per (type, history), the keys are None without store
+def stored_process_models(log_path, types, histories, processes = 1, store = True):
+    if not store:
+        return process_models(variant_log.compress(log_cache.load_log(log_path)), types, histories, processes), {(t, h) : None for t in types for h in histories}
+    log_key = artifact_store.file_hash(log_path)
+    keys = {(t, h) : artifact_store.key("process_model", log_key, {"type" : t, "history" : h}) for t in types for h in histories}
+    models = {}
+    for model, key in keys.items():
+        g = artifact_store.lookup(key)
+        if g is not None:
+            models[model] = g
+    missing = [model for model in keys if model not in models]
+    if missing:
+        built = process_models(variant_log.compress(log_cache.load_log(log_path)), sorted(set(t for t, h in missing)), sorted(set(h for t, h in missing)), processes)
+        for model in missing:
+            models[model] = built[model]
+            artifact_store.store(keys[model], built[model])
+    return {model : models[model] for model in keys}, keys
+
+def output_name(output, input, abstraction_type, history, file_format = graph_format.DEFAULT_FORMAT):
+    return output + "PMODEL" + "_" + "input:"+ input.split("/")[-1].split(".")[0]  + "_" + "type:" + abstraction_type + "_"+ "history:"+ str(history) + graph_format.EXTENSIONS[file_format]
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    if args.update is None:
+        types = ["sequence", "multiset"] if args.type == "both" else [args.type]
+        max_history = args.history if args.max_history is None else args.max_history
+        assert(1 <= args.history <= max_history)
+
+    if args.update is None and not args.save_statistics and not args.no_store:
+        # only the models not in the artifact store are built
+        models, _ = stored_process_models(args.input, types, range(args.history, max_history+1), args.processes)
+        for (abstraction_type, history), g in models.items():
+            name = output_name(args.output, args.input, abstraction_type, history, args.format)
+            graph_format.write_graph(g, name)
+            print("Generated:", name)
+    elif args.update is None:
+        variants = variant_log.compress(log_cache.load_log(args.input))
+        statistics, states, activities = edge_statistics(variants, types, range(args.history, max_history+1), args.processes)
+        labels = {abstraction_type : abstraction.state_labels(states[abstraction_type], activities, abstraction_type) for abstraction_type in types}
+
+        for (abstraction_type, history) in statistics:
+            name = output_name(args.output, args.input, abstraction_type, history, args.format)
+            write_model(statistics[(abstraction_type, history)], labels[abstraction_type], name)
+            if args.save_statistics:
+                transition_statistics.save_statistics(transition_statistics.statistics_path(name), (abstraction_type, history), statistics[(abstraction_type, history)], states[abstraction_type], activities, variants)
+    else:
+        # only the delta log is traversed, the model is rebuilt from the updated statistics
+        variants = variant_log.compress(log_cache.load_log(args.input))
+        model, model_statistics, model_states, activities, model_variants = transition_statistics.load_statistics(transition_statistics.statistics_path(args.update))
+        variant_deltas = transition_statistics.merge_variants(model_variants, variants)
+        statistics = {model : model_statistics}
+        states = {model[0] : model_states}
+        transition_statistics.fold_variants(variant_deltas, statistics, states, activities)
+        labels = abstraction.state_labels(model_states, activities, model[0])
+
+        name = args.output + args.update.split("/")[-1]
+        write_model(model_statistics, labels, name)
+        transition_statistics.save_statistics(transition_statistics.statistics_path(name), model, model_statistics, model_states, activities, model_variants)
@@ -0,0 +1,71 @@
+import networkx as nx
+
+# Reachability index of a game, computed once: the transitive closure over the condensation of the game.
+# Per strongly connected component, the components reachable from it (itself excluded, unless on a cycle)
+# are stored as packed bitset, a python int with bit c set for component c.
+# The queries are answered for all states at once by bit operations on the closure.
+
+# Returns the index (mapping of states to components, closure per component, members per component)
+def closure(g):
+    condensation = nx.condensation(g)
+    mapping = condensation.graph['mapping']
+    members = {c : condensation.nodes[c]['members'] for c in condensation}
+    reach = {}
+    for c in reversed(list(nx.topological_sort(condensation))):
+        r = 0
+        for d in condensation[c]:
+            r |= reach[d] | (1 << d)
+        # states on a cycle reach their own component
+        if len(members[c]) > 1 or any(g.has_edge(s, s) for s in members[c]):
+            r |= 1 << c
+        reach[c] = r
+    return mapping, reach, members
+
+# Bitset of the components containing one of the states
+def component_mask(index, states):
+    mapping, reach, members = index
+    mask = 0
+    for s in states:
+        mask |= 1 << mapping[s]
+    return mask
+
+# States reaching one of the targets, the targets themselves included
+def reaching_states(index, targets):
+    mapping, reach, members = index
+    mask = component_mask(index, targets)
+    return set(s for s in mapping if (reach[mapping[s]] | (1 << mapping[s])) & mask)
+
+# States whose descendants (the state itself excluded) do not have two different values,
+# values maps states to booleans, states without value are ignored
+def agreeing_states(index, values):
+    mapping, reach, members = index
+    positive = component_mask(index, [s for s in values if values[s]])
+    negative = component_mask(index, [s for s in values if not values[s]])
+    counts = {c : [0, 0] for c in members} # per component: states with value False, True
+    for s in values:
+        counts[mapping[s]][int(values[s])] += 1
+    agreeing = set()
+    for s in mapping:
+        c = mapping[s]
+        reached = reach[c]
+        has_positive = bool(reached & ~(1 << c) & positive)
+        has_negative = bool(reached & ~(1 << c) & negative)
+        # the component of the state is only reached by its other states
+        if reached & (1 << c):
+            own = [0, 0]
+            if s in values:
+                own[int(values[s])] = 1
+            has_positive = has_positive or counts[c][1] > own[1]
+            has_negative = has_negative or counts[c][0] > own[0]
+        if not (has_positive and has_negative):
+            agreeing.add(s)
+    return agreeing
+
+# States from which no cycle is reachable (the state itself included), their unrolled sub-games do not depend on the unrolling factor
+def acyclic_states(index):
+    mapping, reach, members = index
+    cyclic = 0
+    for c in reach:
+        if reach[c] & (1 << c):
+            cyclic |= 1 << c
+    return set(s for s in mapping if not (reach[mapping[s]] | (1 << mapping[s])) & cyclic)
@@ -0,0 +1,49 @@
+import networkx as nx
+
+# Quotient graph of the pos/neg reduction, built in a single pass over the edges.
+# The clusters are given as list of (name, states) and merged as by successive calls of
+# nx.contracted_nodes(g, name, s) in the given order: every state is merged into the first cluster containing it.
+# An edge of the quotient graph keeps the attributes of the original edge that contracted_nodes would have
+# remapped first, i.e. the one with the smallest (later, earlier) contraction step of its end points,
+# states that are not merged and the node named like its cluster (contracted into itself) count as step -1
+# (self loops of the clusters may keep other attributes).
+# The attribute 'contraction' is not recorded.
+
+# Returns the quotient graph and the not merged states of g on the decision boundary:
+# they have exactly two successors in the quotient graph, one named like 'pos' and one like 'neg'
+def quotient(g, clusters, self_loops = True):
+    representative = {}
+    step = {}
+    for name, states in clusters:
+        for s in states:
+            if s not in representative:
+                representative[s] = name
+                # contracting the cluster node into itself keeps its edges, it counts as not merged
+                if s != name:
+                    step[s] = len(step)
+
+    q = nx.DiGraph()
+    q.graph.update(g.graph)
+    q.add_nodes_from((s, dict(data)) for s, data in g.nodes(data = True) if s not in representative)
+    q.add_nodes_from(name for name, states in clusters)
+
+    chosen = {}
+    for s, t, data in g.edges(data = True):
+        e = (representative.get(s, s), representative.get(t, t))
+        if e[0] == e[1] and not self_loops:
+            continue
+        order = (max(step.get(s, -1), step.get(t, -1)), min(step.get(s, -1), step.get(t, -1)))
+        if e not in chosen or order < chosen[e][0]:
+            chosen[e] = (order, data)
+    q.add_edges_from((e[0], e[1], dict(data)) for e, (order, data) in chosen.items())
+
+    boundary = []
+    for s in g:
+        if s in representative:
+            continue
+        successors = q[s]
+        pos = any("pos" in n for n in successors)
+        neg = any("neg" in n for n in successors)
+        if pos and neg and len(successors) == 2:
+            boundary.append(s)
+    return q, boundary
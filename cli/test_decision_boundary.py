@@ -0,0 +1,166 @@
+import os
+import sys
+import pytest
+import networkx as nx
+import decision_boundary
+
+# Checks the concurrent verification of query() with a stand-in for verifyta (passed as uppaal_stratego): the stand-in
+# answers a fixed verdict per state after a short delay, for one state it sleeps beyond the query timeout.
+# In the acyclic test game, the initial location of the sub-game of a state has a single edge, to the state;
+# only the initial location of the sub-game of 'start' (the game itself) has several edges
+
+VERDICTS = {"positive" : True, "negative" : False, "s1" : True, "s3" : True, "s4" : False, "s5" : True, "start" : True}
+SLOW = "s5"
+
+STAND_IN = '''#!{python}
+import re, sys, time
+model = open(sys.argv[1]).read()
+init = re.search('<init ref="(id[0-9]+)"/>', model).group(1)
+targets = re.findall('<source ref="' + init + '"/><target ref="(id[0-9]+)"/>', model)
+state = "start" if len(targets) > 1 else re.search('<location id="' + targets[0] + '"[^>]*><name[^>]*>([^<]*)</name>', model).group(1)
+with open({log!r}, "a") as f:
+    f.write("start " + state + " " + str(time.time()) + "\\n")
+time.sleep(30 if state == {slow!r} else 0.2)
+with open({log!r}, "a") as f:
+    f.write("end " + state + " " + str(time.time()) + "\\n")
+print("Formula is " + ("satisfied" if {verdicts!r}[state] else "NOT satisfied"))
+'''
+
+def game():
+    g = nx.DiGraph()
+    for s, t, controllable in [("start", "s1", True), ("start", "s2", True), ("s1", "s3", True), ("s1", "s4", False),
+            ("s2", "s4", True), ("s2", "s5", False), ("s3", "positive", True), ("s3", "negative", False),
+            ("s4", "positive", False), ("s4", "negative", True), ("s5", "positive", True), ("s5", "s4", False)]:
+        g.add_edge(s, t, controllable = controllable, cost = 1)
+    return g
+
+def stand_in(directory):
+    log = os.path.join(directory, "calls.log")
+    path = os.path.join(directory, "verifyta")
+    with open(path, "w") as f:
+        f.write(STAND_IN.format(python = sys.executable, log = log, slow = SLOW, verdicts = VERDICTS))
+    os.chmod(path, 0o755)
+    return path, log
+
+def run(directory, workers):
+    path, log = stand_in(directory)
+    decision_boundary.configure(uppaal_stratego = path, output = os.path.join(directory, ""), workers = workers, query_timeout = 1,
+        no_cache = True, no_layout = True, query = os.path.join(os.path.dirname(os.path.abspath(__file__)), "guaranteed_tool.q"))
+    g, results = decision_boundary.query(game(), decision_boundary.args.query)
+    with open(log) as f:
+        calls = [line.split() for line in f]
+    return results, list(decision_boundary.timed_out), [(kind, state, float(time)) for kind, state, time in calls]
+
+# Whether the verifier calls of two states overlap in time
+def overlapping(calls):
+    intervals = {}
+    for kind, state, time in calls:
+        intervals.setdefault(state, []).append(time)
+    intervals = [times for times in intervals.values() if len(times) == 2] # the timed out call has no end
+    return any(a[0] < b[0] < a[1] for a in intervals for b in intervals if a is not b)
+
+def test_concurrent_equals_sequential(tmp_path):
+    os.mkdir(tmp_path / "sequential")
+    os.mkdir(tmp_path / "concurrent")
+    sequential, sequential_timed_out, sequential_calls = run(str(tmp_path / "sequential"), 1)
+    concurrent, concurrent_timed_out, calls = run(str(tmp_path / "concurrent"), 4)
+    assert(concurrent == sequential)
+    # the slow query exceeds the timeout and is counted as not guaranteed
+    assert(concurrent_timed_out == sequential_timed_out == [SLOW])
+    assert(concurrent[SLOW] == False)
+    assert(all(concurrent[s] == VERDICTS[s] for s in concurrent if s in VERDICTS and s != SLOW))
+    # the workers verify several states at once
+    assert(not overlapping(sequential_calls) and overlapping(calls))
+    # the model files of the queries are removed, also the one of the timed out query
+    for directory in ["sequential", "concurrent"]:
+        assert(sorted(os.listdir(tmp_path / directory)) == ["calls.log", "verifyta"])
+
+    # a state is only verified after the results of its successors are known
+    g = game()
+    order = list(nx.dfs_postorder_nodes(g, "start"))
+    index = {(kind, state) : i for i, (kind, state, time) in enumerate(calls)}
+    for kind, state, time in calls:
+        if kind == "start":
+            for n in g[state]:
+                if ("end", n) in index and order.index(n) < order.index(state):
+                    assert(index[("end", n)] < index[("start", state)])
+
+# Sequential processing of the states in DFS postorder with the attractor backend, as query() before the scheduling:
+# the shortcuts only use the results of states before the current one
+def sequential(g):
+    results = {}
+    for s in nx.dfs_postorder_nodes(g, "start"):
+        sub_nodes = nx.descendants(g, s) | {s}
+        neighbour_results = set(results[n] for n in g[s] if n in results)
+        leaves = [n for n in sub_nodes if g.out_degree(n) == 0 and n != s]
+        leave_results = set(results[n] for n in leaves if n in results)
+        if all(n in results for n in g[s]) and len(neighbour_results) == 1:
+            results[s] = neighbour_results.pop()
+        elif leaves and all(n in results for n in leaves) and len(leave_results) == 1:
+            results[s] = leave_results.pop()
+        else:
+            subgraph = decision_boundary.sub_game(g, s, sub_nodes)
+            target = [n for n in subgraph if "positive" in n or "negative" in n]
+            results[s] = decision_boundary.game_solver.solve(decision_boundary.unroll(subgraph, "start", target, decision_boundary.args.unrolling_factor))
+    return results
+
+def test_leaf_shortcut_equals_sequential(tmp_path):
+    # s1 reaches only the leaf 'positive', which is after s1 in the postorder,
+    # but the environment can move from s1 to the self-loop of s3 that never reaches positive
+    g = nx.DiGraph()
+    for s, t, controllable in [("start", "s0", True), ("start", "s1", True), ("start", "s2", False), ("start", "s3", False),
+            ("s0", "s1", True), ("s0", "s2", True), ("s0", "positive", True), ("s1", "s0", False), ("s1", "s3", False),
+            ("s2", "s3", False), ("s2", "positive", True), ("s3", "s3", True)]:
+        g.add_edge(s, t, controllable = controllable, cost = 1)
+    decision_boundary.configure(backend = "attractor", unrolling_factor = 1, output = os.path.join(str(tmp_path), ""),
+        query = os.path.join(os.path.dirname(os.path.abspath(__file__)), "guaranteed_tool.q"))
+    expected = sequential(g)
+    assert(expected["s1"] == False)
+    g, results = decision_boundary.query(g, decision_boundary.args.query)
+    assert(results == expected)
+
+# Stand-in for verifyta on a batched model: prints the verdicts of the first queries, then exceeds the timeout
+BATCH_STAND_IN = '''#!{python}
+import sys, time
+print("Formula is satisfied", flush = True)
+print("Formula is NOT satisfied", flush = True)
+time.sleep(30)
+'''
+
+def test_batch_timeout_keeps_printed_verdicts(tmp_path):
+    path = str(tmp_path / "verifyta")
+    with open(path, "w") as f:
+        f.write(BATCH_STAND_IN.format(python = sys.executable))
+    os.chmod(path, 0o755)
+    decision_boundary.configure(uppaal_stratego = path, output = os.path.join(str(tmp_path), ""), query_timeout = 0.5, no_layout = True)
+    query = os.path.join(os.path.dirname(os.path.abspath(__file__)), "guaranteed_tool.q")
+    assert(decision_boundary.verify_batch([game(), game(), game()], query) == [True, False, None])
+
+def test_batch_formula():
+    directory = os.path.dirname(os.path.abspath(__file__))
+    assert(decision_boundary.batch_formula(os.path.join(directory, "guaranteed_tool.q")) == "reached_positive")
+    # several queries can not be combined into one batched model
+    with pytest.raises(ValueError):
+        decision_boundary.batch_formula(os.path.join(directory, "..", "queries.q"))
+
+def test_warm_start_checks_parameters(tmp_path):
+    decision_boundary.configure(backend = "attractor", unrolling_factor = 1, output = os.path.join(str(tmp_path), ""),
+        query = os.path.join(os.path.dirname(os.path.abspath(__file__)), "guaranteed_tool.q"))
+    previous = decision_boundary.decision_boundary(game())
+    # the parameters are kept in the written file
+    path = str(tmp_path / "DECB.gexf")
+    decision_boundary.graph_format.write_graph(previous, path)
+    previous = decision_boundary.graph_format.read_graph(path)
+
+    decision_boundary.configure(backend = "attractor", unrolling_factor = 2, output = os.path.join(str(tmp_path), ""),
+        query = os.path.join(os.path.dirname(os.path.abspath(__file__)), "guaranteed_tool.q"))
+    decision_boundary.check_warm_start(previous, game())
+    # another game
+    other = game()
+    other["s3"]["negative"]["controllable"] = True
+    with pytest.raises(ValueError):
+        decision_boundary.check_warm_start(previous, other)
+    # other options
+    decision_boundary.args.static = True
+    with pytest.raises(ValueError):
+        decision_boundary.check_warm_start(previous, game())
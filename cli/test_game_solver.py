@@ -0,0 +1,43 @@
+import networkx as nx
+import game_solver
+
+# Checks the attractor of game_solver.py on small hand-built games, edges are given as (source, target, controllable)
+
+def game(edges):
+    g = nx.DiGraph()
+    for s, t, controllable in edges:
+        g.add_edge(s, t, controllable = controllable, cost = 1)
+    return g
+
+def test_controllable_escape():
+    # the controller avoids the negative outcome by its own edge
+    g = game([("start", "s1", True), ("s1", "negative", True), ("s1", "positive", True)])
+    assert(game_solver.attractor(g) == {"positive", "s1", "start"})
+    assert(game_solver.solve(g))
+
+def test_uncontrollable_trap():
+    # the environment moves to the negative outcome, a controllable edge to positive does not help
+    g = game([("start", "s1", True), ("s1", "negative", False), ("s1", "positive", True),
+        ("start", "s2", False), ("s2", "positive", False), ("s2", "s3", False), ("s3", "positive", True)])
+    assert(game_solver.attractor(g) == {"positive", "s2", "s3"})
+    assert(not game_solver.solve(g))
+    # a state with only uncontrollable edges is winning if all of them are
+    g.remove_edge("start", "s1")
+    assert(game_solver.solve(g))
+
+def test_self_loop():
+    # the environment can stay on the cycle forever without reaching positive
+    g = game([("start", "s1", True), ("s1", "s1", False), ("s1", "positive", False)])
+    assert(game_solver.attractor(g) == {"positive"})
+    assert(not game_solver.solve(g))
+    # a controllable cycle is left by the controller
+    g["s1"]["s1"]["controllable"] = True
+    g["s1"]["positive"]["controllable"] = True
+    assert(game_solver.solve(g))
+
+def test_dead_end():
+    # states without outgoing edges that are no goal are losing
+    g = game([("start", "s1", False), ("start", "positive", False), ("s2", "positive", True)])
+    assert(game_solver.attractor(g) == {"positive", "s2"})
+    assert(not game_solver.solve(g))
+    assert(game_solver.solve(g, "s2"))
@@ -0,0 +1,72 @@
+import os
+import sys
+import random
+import subprocess
+import xes_writer
+
+# Checks that process_model.py writes the same models with several worker processes (-p) and after updates (-u)
+# as the sequential build on the whole log, byte for byte (apart from the modification date of the .gexf files).
+# The tools run as in the command line, the log cache and the artifact store are kept in the test directory.
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+ACTIVITIES = ["a", "b", "c", "d", "e"]
+
+# Random traces from 'start' to 'positive' or 'negative'
+def traces(count, seed):
+    rng = random.Random(seed)
+    log = []
+    for i in range(count):
+        activities = ["start"] + [rng.choice(ACTIVITIES) for j in range(rng.randint(1, 6))] + [rng.choice(["positive", "negative"])]
+        log.append([{"concept:name" : a} for a in activities])
+    return log
+
+def write_log(tmp_path, name, log):
+    path = str(tmp_path / name)
+    xes_writer.write_xes(log, path)
+    return path
+
+def process_model(tmp_path, output, *arguments):
+    os.makedirs(output, exist_ok = True)
+    environment = dict(os.environ, BPI_GAMES_CACHE = str(tmp_path / "logs"), BPI_GAMES_ARTIFACTS = str(tmp_path / "artifacts"))
+    subprocess.run([sys.executable, os.path.join(DIRECTORY, "process_model.py"), *arguments], cwd = output, env = environment, check = True, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+
+# Models written to the directory, per type and history; the line with the modification date is skipped
+def models(directory):
+    written = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".gexf"):
+            with open(os.path.join(directory, name)) as f:
+                written[name.split("_type:")[-1]] = [line for line in f if "lastmodifieddate" not in line]
+    return written
+
+def test_parallel_equals_sequential(tmp_path):
+    log = write_log(tmp_path, "log.xes", traces(200, 0))
+    for processes in ["1", "3"]:
+        # -ns: the parallel build is not taken from the store
+        process_model(tmp_path, str(tmp_path / processes), log, "./", "-t", "both", "-hist", "1", "-max_hist", "4", "-p", processes, "-ns")
+    sequential = models(tmp_path / "1")
+    assert(len(sequential) == 8)
+    # 3 processes split the variants into 12 shards of few variants
+    assert(models(tmp_path / "3") == sequential)
+
+def test_update_equals_rebuild(tmp_path):
+    first = traces(60, 1)
+    second = first[:20] + traces(40, 2) # known and new variants
+    third = traces(30, 3) + first[40:]
+    log = write_log(tmp_path, "log.xes", first)
+    process_model(tmp_path, str(tmp_path / "built"), log, "./", "-t", "both", "-hist", "1", "-max_hist", "3", "-stats")
+    for name in os.listdir(tmp_path / "built"):
+        if name.endswith(".gexf"):
+            model = str(tmp_path / "built" / name)
+            process_model(tmp_path, str(tmp_path / "updated"), write_log(tmp_path, "second.xes", second), "./", "-u", model)
+            # chained update of the updated model
+            process_model(tmp_path, str(tmp_path / "chained"), write_log(tmp_path, "third.xes", third), "./", "-u", str(tmp_path / "updated" / name))
+
+    process_model(tmp_path, str(tmp_path / "rebuilt"), write_log(tmp_path, "log.xes", first + second), "./", "-t", "both", "-hist", "1", "-max_hist", "3", "-ns")
+    rebuilt = models(tmp_path / "rebuilt")
+    assert(len(rebuilt) == 6)
+    assert(models(tmp_path / "updated") == rebuilt)
+    assert(models(tmp_path / "updated") != models(tmp_path / "built"))
+
+    process_model(tmp_path, str(tmp_path / "rebuilt_chained"), write_log(tmp_path, "log.xes", first + second + third), "./", "-t", "both", "-hist", "1", "-max_hist", "3", "-ns")
+    assert(models(tmp_path / "chained") == models(tmp_path / "rebuilt_chained"))
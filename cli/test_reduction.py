@@ -0,0 +1,53 @@
+import random
+import networkx as nx
+import reduction
+
+# Checks reduction.quotient against successive nx.contracted_nodes calls on small games
+
+def contracted(g, clusters):
+    merged = set()
+    for name, states in clusters:
+        for s in states:
+            if s not in merged:
+                merged.add(s)
+                # contracting a node into itself re-adds its edges unchanged (and fails for isolated nodes)
+                if s != name:
+                    g = nx.contracted_nodes(g, name, s)
+    g.remove_edges_from(list(nx.selfloop_edges(g)))
+    return g
+
+def edges(g):
+    return {(s, t) : {k : v for k, v in data.items() if k != 'contraction'} for s, t, data in g.edges(data = True)}
+
+def random_game(rng):
+    g = nx.DiGraph()
+    nodes = ["s" + str(i) for i in range(rng.randint(1, 8))] + ["pos", "neg"]
+    rng.shuffle(nodes)
+    g.add_nodes_from(nodes)
+    for s in nodes:
+        for t in nodes:
+            if s not in ["pos", "neg"] and rng.random() < 0.3:
+                g.add_edge(s, t, cost = round(rng.uniform(-5, 5), 2), controllable = rng.random() < 0.5)
+    return g
+
+def test_cluster_node_keeps_its_edges():
+    g = nx.DiGraph()
+    g.add_edge("s1", "pos", cost = -3.67, controllable = True)
+    g.add_edge("s1", "s0", cost = -2.54, controllable = False)
+    q, boundary = reduction.quotient(g, [("pos", ["s0", "pos"])])
+    assert(q["s1"]["pos"] == {"cost" : -3.67, "controllable" : True})
+
+def test_quotient_equals_contracted_nodes():
+    rng = random.Random(1)
+    for i in range(500):
+        g = random_game(rng)
+        states = [s for s in g if s not in ["pos", "neg"]]
+        positive = [s for s in g if s == "pos" or (s != "neg" and rng.random() < 0.4)]
+        negative = [s for s in g if s == "neg" or (s in states and s not in positive and rng.random() < 0.5)]
+        rng.shuffle(positive)
+        rng.shuffle(negative)
+        clusters = [("pos", positive), ("neg", negative)]
+        q, boundary = reduction.quotient(g, clusters, self_loops = False)
+        expected = contracted(g.copy(), clusters)
+        assert(set(q) == set(expected))
+        assert(edges(q) == edges(expected))
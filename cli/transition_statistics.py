@@ -0,0 +1,144 @@
+import os
+import json
+import functools
+import multiprocessing
+import abstraction
+
+# Edge statistics of transition systems, built from variant-compressed logs (see variant_log.py).
+# Per model (type, history) and edge (source state id, target state id), in order of first occurrence:
+# {'action': activity, 'traversal': n, 'positive': p, 'negative': q}
+
+# Folds variants into the edge statistics of the models, collects per model and edge (hash-indexed, in order of first occurrence):
+# the action, the traversal count and the positive/negative outcome tallies,
+# every variant is weighted by its multiplicity
+# variant_deltas contains (variant with the counts to add, is new variant); variants already
+# contained in the statistics only add their counts, the traversed edges and states are already known
+# States are the interned ids of the rolling windows, see abstraction.py
+def fold_variants(variant_deltas, statistics, states, activities):
+    for variant, new in variant_deltas:
+        trace = variant['activities']
+        assert(trace[0]=="start")
+        codes = abstraction.activity_codes(trace, activities)
+        for model in statistics:
+            model_states = states[model[0]]
+            model_statistics = statistics[model]
+            s = 0
+            for pos_index, key in enumerate(abstraction.keys(model[0])(codes, model[1]), 1):
+                t = abstraction.intern(model_states, key)
+                e = (s,t)
+                if e not in model_statistics:
+                    model_statistics[e] = {'action': trace[pos_index], 'traversal': 0, 'positive': 0, 'negative': 0}
+                edge = model_statistics[e]
+                if new:
+                    edge['action'] = trace[pos_index]
+                edge['traversal'] += variant['count']
+                edge['positive'] += variant['positive']
+                edge['negative'] += variant['negative']
+                s = t
+
+# Single pass over the variant-compressed log
+# Returns a dict mapping (type, history) to the edge statistics of the respective model,
+# the interned states per type and the interned activities
+def edge_statistics(variants, histories, types):
+    models = [(abstraction_type, history) for abstraction_type in types for history in histories]
+    statistics = {model : {} for model in models}
+    activities = {}
+    states = {abstraction_type : {abstraction.START : 0} for abstraction_type in types}
+    fold_variants([(variant, True) for variant in variants], statistics, states, activities)
+    return statistics, states, activities
+
+# Parallel construction: the variant list is split into contiguous shards, every shard is folded by a worker process.
+# Partial statistics are keyed by state keys instead of state ids, such that they are independent of the
+# worker-local interning and can be merged in any grouping (the merge is associative, shards are merged in order).
+
+# Worker: folds a shard of variants, returns the partial statistics keyed by (source key, target key)
+def shard_statistics(shard):
+    variants, histories, types, activities = shard
+    statistics = {(abstraction_type, history) : {} for abstraction_type in types for history in histories}
+    states = {abstraction_type : {abstraction.START : 0} for abstraction_type in types}
+    fold_variants([(variant, True) for variant in variants], statistics, states, dict(activities))
+    keys = {abstraction_type : list(states[abstraction_type]) for abstraction_type in types}
+    return {model : {(keys[model[0]][e[0]], keys[model[0]][e[1]]) : edge for e, edge in statistics[model].items()} for model in statistics}
+
+# Merges the partial statistics of a later shard into the partial statistics of an earlier shard:
+# counts are added and the action is taken from the later shard,
+# new edges are appended, which keeps the order of first occurrence
+def merge_statistics(statistics, later):
+    for model in later:
+        model_statistics = statistics[model]
+        for e, edge in later[model].items():
+            if e not in model_statistics:
+                model_statistics[e] = edge
+                continue
+            merged = model_statistics[e]
+            merged['action'] = edge['action']
+            for count in ['traversal', 'positive', 'negative']:
+                merged[count] += edge[count]
+    return statistics
+
+# Interns the state keys of merged partial statistics, in order of first occurrence of the edges
+def intern_statistics(keyed, types):
+    states = {abstraction_type : {abstraction.START : 0} for abstraction_type in types}
+    statistics = {}
+    for model in keyed:
+        model_states = states[model[0]]
+        statistics[model] = {(abstraction.intern(model_states, e[0]), abstraction.intern(model_states, e[1])) : edge for e, edge in keyed[model].items()}
+    return statistics, states
+
+# Parallel variant of edge_statistics with the given number of worker processes, the result is identical up to the state ids
+# Activities are interned upfront, such that all workers use the same activity codes
+def parallel_edge_statistics(variants, histories, types, processes):
+    activities = {}
+    for variant in variants:
+        abstraction.activity_codes(variant['activities'], activities)
+    shard_size = max(1, -(-len(variants) // (4*processes))) # several shards per worker for load balancing
+    shards = [(variants[i:i+shard_size], list(histories), types, activities) for i in range(0, len(variants), shard_size)]
+    with multiprocessing.Pool(processes) as pool:
+        partials = pool.map(shard_statistics, shards)
+    keyed = functools.reduce(merge_statistics, partials, {(abstraction_type, history) : {} for abstraction_type in types for history in histories})
+    statistics, states = intern_statistics(keyed, types)
+    return statistics, states, activities
+
+# Adds the delta variants to the variants of the model, returns the variant deltas for fold_variants
+def merge_variants(variants, delta):
+    index = {variants[i]['activities'] : i for i in range(len(variants))}
+    variant_deltas = []
+    for variant in delta:
+        if variant['activities'] in index:
+            known = variants[index[variant['activities']]]
+            for count in ['count', 'positive', 'negative']:
+                known[count] += variant[count]
+            variant_deltas.append((variant, False))
+        else:
+            variants.append(dict(variant))
+            index[variant['activities']] = len(variants)-1
+            variant_deltas.append((variant, True))
+    return variant_deltas
+
+def statistics_path(model_path):
+    return os.path.splitext(model_path)[0] + ".stats.json"
+
+# Persists the edge statistics of a single model together with the interned states and activities and the variants
+def save_statistics(path, model, statistics, states, activities, variants):
+    codes = {name : code for code, name in enumerate(activities)}
+    data = {
+        "type": model[0],
+        "history": model[1],
+        "activities": list(activities),
+        "states": [list(key) for key in states],
+        "variants": [[[codes[a] for a in v['activities']], v['count'], v['positive'], v['negative']] for v in variants],
+        "edges": [[e[0], e[1], edge['action'], edge['traversal'], edge['positive'], edge['negative']] for e, edge in statistics.items()],
+    }
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+# Inverse of save_statistics
+def load_statistics(path):
+    with open(path) as f:
+        data = json.load(f)
+    model = (data["type"], data["history"])
+    activities = {name : code for code, name in enumerate(data["activities"])}
+    states = {tuple(key) : i for i, key in enumerate(data["states"])}
+    variants = [{'activities': tuple(data["activities"][c] for c in v[0]), 'count': v[1], 'positive': v[2], 'negative': v[3]} for v in data["variants"]]
+    statistics = {(e[0], e[1]) : {'action': e[2], 'traversal': e[3], 'positive': e[4], 'negative': e[5]} for e in data["edges"]}
+    return model, statistics, states, activities, variants
@@ -0,0 +1,25 @@
+# Variant-compressed event log: every distinct activity sequence is stored once,
+# with its multiplicity and the number of positive and negative traces.
+# A variant log is a list of dicts {'activities': tuple of activity names, 'count': n, 'positive': p, 'negative': q},
+# in order of the first occurrence of the variant in the log.
+
+def outcome(activities):
+    return 1 if any("positive" in a for a in activities) else -1
+
+# Compresses a log (iterable of traces), works on pm4py logs and logs in list format
+def compress(log):
+    variants = {}
+    for trace in log:
+        activities = tuple(pos['concept:name'] for pos in trace)
+        if activities not in variants:
+            variants[activities] = {'activities': activities, 'count': 0, 'positive': 0, 'negative': 0}
+        variant = variants[activities]
+        variant['count'] += 1
+        variant['positive' if outcome(activities) == 1 else 'negative'] += 1
+    return list(variants.values())
+
+def is_variant_log(log):
+    return isinstance(log, list) and len(log) > 0 and isinstance(log[0], dict) and 'activities' in log[0]
+
+def number_traces(variants):
+    return sum(variant['count'] for variant in variants)
@@ -0,0 +1,77 @@
+import os
+import glob
+import json
+import hashlib
+import threading
+
+# Persistent cache for verification results of (unrolled) games.
+# Games are keyed on a canonical hash of everything the UPPAAL model and the query depend on:
+# structure, controllability and rounded cost of the edges, the kind of the locations (goal states etc.) and the query file.
+# State names are not part of the key, such that structurally identical games of different states share their verdict.
+# The cache directory is set by the environment variable BPI_GAMES_VERDICTS, default: ~/.cache/bpi_games/verdicts
+
+CACHE_VERSION = 1
+
+def cache_directory():
+    return os.environ.get("BPI_GAMES_VERDICTS", os.path.join(os.path.expanduser("~"), ".cache", "bpi_games", "verdicts"))
+
+# Kind of a location as distinguished by the UPPAAL model (see to_uppaal in decision_boundary.py)
+def location_kind(s):
+    for kind in ["positive", "negative", "outOfGas"]:
+        if kind in str(s):
+            return kind
+    return "state"
+
+def edge_label(g, s, t):
+    return [int(g[s][t]['controllable']), int(round(g[s][t]['cost']))]
+
+# Canonical encoding of the game: states are numbered in breadth-first order from the initial state,
+# successors ordered by location kind and edge label; remaining ties are broken by name, which may only cause
+# misses for isomorphic games, never equal encodings for different games
+def canonical_encoding(g, initial = "start"):
+    order = {initial : 0}
+    queue = [initial]
+    for s in queue:
+        for t in sorted(g[s], key = lambda t: (location_kind(t), edge_label(g, s, t), str(t))):
+            if t not in order:
+                order[t] = len(order)
+                queue.append(t)
+    for s in sorted(g, key = str): # states not reachable from the initial state
+        if s not in order:
+            order[s] = len(order)
+            queue.append(s)
+    return [[location_kind(s), sorted([order[t]] + edge_label(g, s, t) for t in g[s])] for s in queue]
+
+def game_hash(g, query_path):
+    h = hashlib.sha256()
+    with open(query_path, "rb") as f:
+        h.update(f.read())
+    h.update(json.dumps([CACHE_VERSION, canonical_encoding(g)]).encode())
+    return h.hexdigest()
+
+# Returns the cached verdict, None on a cache miss
+def lookup(key):
+    try:
+        with open(os.path.join(cache_directory(), key)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def tmp_path(key, pid, thread):
+    return os.path.join(cache_directory(), key) + ".tmp" + str(pid) + "_" + str(thread)
+
+def store(key, result):
+    os.makedirs(cache_directory(), exist_ok=True)
+    path = os.path.join(cache_directory(), key)
+    tmp = tmp_path(key, os.getpid(), threading.get_ident())
+    with open(tmp, "w") as f:
+        json.dump(result, f)
+    os.replace(tmp, path) # atomic, concurrent runs never read partial files
+
+# Removes the partially written verdicts of the (killed) process pid
+def remove_temporary(pid):
+    for name in glob.glob(tmp_path("*", pid, "*")):
+        try:
+            os.remove(name)
+        except OSError:
+            pass
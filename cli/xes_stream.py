@@ -0,0 +1,50 @@
+import xml.etree.ElementTree as ET
+from pm4py.objects.log.obj import Trace, Event
+from pm4py.util.dt_parsing import parser as dt_parser
+
+# Streaming XES reader: yields one pm4py trace at a time, the parsed elements of a trace are released after it is yielded.
+# Peak memory is proportional to the largest trace instead of the log.
+# Attribute values are converted as by pm4py's XES importer, nested attributes are stored as {'value': ..., 'children': ...}
+
+def local_name(tag):
+    return tag.split("}")[-1]
+
+def parse_value(elem, date_parser):
+    tag = local_name(elem.tag)
+    value = elem.get("value")
+    if tag == "date":
+        return date_parser.apply(value)
+    if tag == "int":
+        return int(value)
+    if tag == "float":
+        return float(value)
+    if tag == "boolean":
+        return str(value).lower() == "true"
+    if tag in ["list", "container"]:
+        return None
+    return value # string and id
+
+def parse_attributes(elem, date_parser):
+    attributes = {}
+    for child in elem:
+        if local_name(child.tag) in ["event", "trace"]:
+            continue
+        value = parse_value(child, date_parser)
+        if len(child):
+            value = {'value': value, 'children': parse_attributes(child, date_parser)}
+        attributes[child.get("key")] = value
+    return attributes
+
+def read_traces(path):
+    date_parser = dt_parser.get()
+    root = None
+    for tree_event, elem in ET.iterparse(path, events = ("start", "end")):
+        if root is None:
+            root = elem
+        if tree_event != "end" or local_name(elem.tag) != "trace":
+            continue
+        events = [Event(parse_attributes(e, date_parser)) for e in elem if local_name(e.tag) == "event"]
+        trace = Trace(events, attributes = parse_attributes(elem, date_parser))
+        elem.clear()
+        root.clear() # drop the references to already processed traces
+        yield trace
@@ -0,0 +1,72 @@
+from xml.sax.saxutils import quoteattr
+from pm4py.objects.log.obj import Trace, Event
+import log_cache
+
+# Streaming XES writer for logs in list format (list of traces, every trace a list of event dicts).
+# Traces are written one at a time, without intermediate DataFrame or pm4py event log.
+# Attributes with the prefix 'case:' are written as trace attributes (taken from the first event), as in pm4py's conversion.
+
+CASE_PREFIX = "case:"
+
+# XES type per python type, other types are written as string
+TYPES = {"str": "string", "int": "int", "int64": "int", "float": "float", "float64": "float", "bool": "boolean", "datetime": "date", "Timestamp": "date"}
+
+HEADER = '''<?xml version='1.0' encoding='UTF-8'?>
+<log xes.version="1849-2016" xes.features="nested-attributes" openxes.version="1.0RC7">
+\t<extension name="Concept" prefix="concept" uri="http://www.xes-standard.org/concept.xesext" />
+\t<extension name="Time" prefix="time" uri="http://www.xes-standard.org/time.xesext" />
+\t<extension name="Lifecycle" prefix="lifecycle" uri="http://www.xes-standard.org/lifecycle.xesext" />
+'''
+
+def xes_type(key, value):
+    return "string" if key == "concept:name" else TYPES.get(type(value).__name__, "string")
+
+def attribute(key, value, indent):
+    t = xes_type(key, value)
+    if t == "date":
+        value = value.isoformat()
+    elif t == "boolean":
+        value = str(value).lower()
+    return "\t"*indent + "<%s key=%s value=%s />\n" % (t, quoteattr(key), quoteattr(str(value)))
+
+# Splits a trace into trace attributes and events without case attributes
+def split_case_attributes(trace):
+    attributes = {k[len(CASE_PREFIX):] : v for k, v in trace[0].items() if k.startswith(CASE_PREFIX) and v is not None}
+    events = [{k : v for k, v in event.items() if not k.startswith(CASE_PREFIX) and v is not None} for event in trace]
+    return attributes, events
+
+def trace_to_xes(attributes, events):
+    lines = ["\t<trace>\n"]
+    for key in attributes:
+        lines.append(attribute(key, attributes[key], 2))
+    for event in events:
+        lines.append("\t\t<event>\n")
+        for key in event:
+            lines.append(attribute(key, event[key], 3))
+        lines.append("\t\t</event>\n")
+    lines.append("\t</trace>\n")
+    return "".join(lines)
+
+# Value as read back by the XES import
+def imported_value(key, value):
+    converters = {"string": str, "int": int, "float": float, "boolean": bool}
+    t = xes_type(key, value)
+    if t == "date":
+        return value.to_pydatetime() if hasattr(value, "to_pydatetime") else value
+    return converters[t](value)
+
+# Writes the log as XES, trace by trace; with columnar the written log is also stored
+# in the binary columnar log cache, such that later tools load it without XES import.
+# The cache is written from the whole log at the end, so columnar needs memory proportional to the log
+def write_xes(log, path, columnar = False):
+    collected = []
+    with open(path, "w", encoding = "utf-8") as f:
+        f.write(HEADER)
+        for trace in log:
+            attributes, events = split_case_attributes(trace)
+            f.write(trace_to_xes(attributes, events))
+            if columnar:
+                collected.append(Trace([Event({k : imported_value(k, v) for k, v in e.items()}) for e in events], attributes = {k : imported_value(k, v) for k, v in attributes.items()}))
+        f.write("</log>\n")
+    if columnar:
+        log_cache.write_columns(collected, log_cache.cache_path(path))
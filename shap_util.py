@@ -7,7 +7,16 @@ import numpy as np
 import json 
 import pandas as pd 
 import copy
+import os
+import importlib.util
 import networkx as nx 
+from collections import deque
+
+# the cli tools are plain scripts, not a package: variant_log.py is loaded by its path, such that the cli modules
+# do not shadow other modules of the notebook
+_variant_log_spec = importlib.util.spec_from_file_location("variant_log", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli", "variant_log.py"))
+variant_log = importlib.util.module_from_spec(_variant_log_spec)
+_variant_log_spec.loader.exec_module(variant_log)
 
 def ms(trace):
     multiset = {}
@@ -24,7 +33,60 @@ def hist(trace):
         hist += " - " + str(pos['concept:name']) # construct history
     return hist
 
+# Variant-compressed logs (list of dicts {'activities': tuple of activity names, 'count': n, 'positive': p, 'negative': q}),
+# the representation of cli/variant_log.py that model building uses; every variant is one sample, weighted by its multiplicity
+compress_variants = variant_log.compress
+is_variant_log = variant_log.is_variant_log
+
+# Traces of the log, one per variant for variant-compressed logs
+def traces(log):
+    if is_variant_log(log):
+        return [[{'concept:name': a} for a in variant['activities']] for variant in log]
+    return log
+
+def sample_weights(log):
+    if is_variant_log(log):
+        return np.array([variant['count'] for variant in log])
+    return np.ones(len(log))
+
+def outcomes(log):
+    return [(1 if 'positive' in [e['concept:name'] for e in t] else 0) for t in traces(log)]
+
+# Background data for the explainer, variants are drawn by their multiplicity
+def background_sample(X, log, sample):
+    if is_variant_log(log):
+        return X.sample(n=min(sample, len(X)), weights=sample_weights(log), random_state=0)
+    return shap.sample(X, sample)
+
+# Rolling-window state keys for ms and hist: per event the window is updated by the new
+# and the expired activity instead of rebuilding the state label
+def window_keys(trace, abstraction, hist_length):
+    window = deque()
+    multiset = {}
+    for pos in trace:
+        name = pos['concept:name']
+        window.append(name)
+        if abstraction is ms:
+            multiset[name] = multiset.get(name, 0) + 1
+        if len(window) > hist_length:
+            expired = window.popleft()
+            if abstraction is ms:
+                multiset[expired] -= 1
+                if multiset[expired] == 0:
+                    del multiset[expired]
+        yield frozenset(multiset.items()) if abstraction is ms else tuple(window)
+
+# Key of a state label of the system, comparable to the keys of window_keys
+def label_key(label, abstraction):
+    if abstraction is ms:
+        try:
+            return frozenset(json.loads(label).items())
+        except (ValueError, AttributeError):
+            return None # no multiset label, e.g. "start"
+    return tuple(label.split(" - "))
+
 def to_df_one_hot_inner(log, system, limit, abstraction, hist_length):
+    log = traces(log)
     system = copy.deepcopy(system)
     system = nx.relabel_nodes(system, {'pos':'positive', 'neg':'negative'})
     
@@ -33,15 +95,24 @@ def to_df_one_hot_inner(log, system, limit, abstraction, hist_length):
         log_acitivities.update(set([t['concept:name'] for t in trace]))
     #log_acitivities.add("y")
     trace_df = pd.DataFrame(columns = list(log_acitivities))
+    rolling = abstraction is ms or abstraction is hist
+    if rolling:
+        states = set(label_key(s, abstraction) for s in system.nodes())
+    else:
+        states = set(system.nodes())
     data_list = []
     for trace in log:
         trace_edges = [x['concept:name'] for x in trace]
         data = {}
         assert(trace[0]['concept:name']=="start")
+        keys = window_keys(trace, abstraction, hist_length) if rolling else None
         for i in range(max(1,len(trace)-limit)): #range(1,len(trace_edges)):
-            t = abstraction(trace[max(0,i-hist_length+1):i+1])
+            if rolling:
+                t = next(keys)
+            else:
+                t = abstraction(trace[max(0,i-hist_length+1):i+1])
             current = trace_edges[i]
-            if t not in list(system.nodes()):
+            if t not in states:
                 continue
             if current not in data:
                 data[current] = 1
@@ -54,7 +125,8 @@ def to_df_one_hot_inner(log, system, limit, abstraction, hist_length):
     return trace_df
 
 def beeswarm_comparison(removed_columns, log, system, abstraction, hist_length, name='tree', limit_start=0, limit_end=25+1, sample=200, plot=False):
-    Y = [(1 if 'positive' in [e['concept:name'] for e in t] else 0) for t in log] # construct Y values from log    
+    Y = outcomes(log) # construct Y values from log    
+    weights = sample_weights(log)
 
     for limit in range(limit_start, limit_end+1):
         df_one_hot = to_df_one_hot_inner(log, system, limit, abstraction, hist_length)
@@ -66,9 +138,9 @@ def beeswarm_comparison(removed_columns, log, system, abstraction, hist_length,
             X = df_one_hot.drop(['negative'], axis=1)
                     
         clf = tree.DecisionTreeClassifier()
-        clf = clf.fit(X, Y)
+        clf = clf.fit(X, Y, sample_weight=weights)
 
-        sub_data = shap.sample(X, sample)
+        sub_data = background_sample(X, log, sample)
         # sub_data.rename(columns={r : r+' (REMOVED)' if r in removed_columns else r for r in list(sub_data.columns)}, inplace=True)
         explainer = shap.KernelExplainer(clf.predict_proba, data=sub_data, feature_names=['t'])# KernelExplainer
         # shap_values = explainer.shap_values(sub_data)
@@ -95,11 +167,16 @@ def beeswarm_comparison(removed_columns, log, system, abstraction, hist_length,
         else:
             plt.clf()
         
-def print_accuracy(pred, Y):
-    print(f"Accuracy = {100 * np.sum(pred == Y) / len(Y)}%")
+def accuracy(pred, Y, weights):
+    return 100 * np.sum(weights * (pred == np.array(Y))) / np.sum(weights)
+
+def print_accuracy(pred, Y, weights=None):
+    weights = np.ones(len(Y)) if weights is None else weights
+    print(f"Accuracy = {accuracy(pred, Y, weights)}%")
     
 def compare_trees(log, system, abstraction, hist_length, removed_columns, limit_start=0, limit_end=25+1):
-    Y = [(1 if 'positive' in [e['concept:name'] for e in t] else 0) for t in log] # construct Y values from log    
+    Y = outcomes(log) # construct Y values from log    
+    weights = sample_weights(log)
 
     result_string = ""
     for limit in range(limit_start, limit_end+1):
@@ -117,7 +194,7 @@ def compare_trees(log, system, abstraction, hist_length, removed_columns, limit_
             X = df_one_hot.drop(['negative'], axis=1)
         
         clf = tree.DecisionTreeClassifier()
-        clf = clf.fit(X, Y)
+        clf = clf.fit(X, Y, sample_weight=weights)
         
         
         X_columns = X.columns
@@ -136,9 +213,9 @@ def compare_trees(log, system, abstraction, hist_length, removed_columns, limit_
                     removed_counter += 1
                     print(f'Used {X_columns[feature[i]]}')
         print(f'used {removed_counter}/{split_counter} removed features')
-        print_accuracy(clf.predict(X), Y)
+        print_accuracy(clf.predict(X), Y, weights)
         
-        result_string += (str(np.round(100 * np.sum(clf.predict(X) == Y) / len(Y), 2)) + ("" if limit == limit_end  else " & "))
+        result_string += (str(np.round(accuracy(clf.predict(X), Y, weights), 2)) + ("" if limit == limit_end  else " & "))
         
         # tree.plot_tree(clf, feature_names=X_columns)
         